@@ -0,0 +1,62 @@
+import functools
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from django.http import HttpResponse
+from django.urls import URLPattern
+
+
+ASYNC_ROUTES = {
+    'recipes-list',
+    'recipes-detail',
+    'recipes-download-shopping-cart',
+    'tags-list',
+    'tags-detail',
+    'ingredients-list',
+    'ingredients-detail',
+}
+
+
+def materialize(response):
+    '''Read the streaming response while the database is at hand'''
+    content = HttpResponse(b''.join(response.streaming_content),
+                           status=response.status_code)
+    for header, value in response.items():
+        content[header] = value
+    return content
+
+
+def call_view(view, request, *args, **kwargs):
+    '''Run the sync view and render its response in a worker thread'''
+    close_old_connections()
+    try:
+        response = view(request, *args, **kwargs)
+        if callable(getattr(response, 'render', None)):
+            response.render()
+        if response.streaming:
+            response = materialize(response)
+        return response
+    finally:
+        close_old_connections()
+
+
+def async_view(view):
+    '''Async view which leaves the event loop free while the sync view
+    works in the thread pool and sends the response to slow clients'''
+    run = sync_to_async(call_view, thread_sensitive=False)
+
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        return await run(view, request, *args, **kwargs)
+
+    return wrapper
+
+
+def async_patterns(patterns):
+    '''Router patterns with the read-heavy routes served asynchronously'''
+    return [
+        URLPattern(pattern.pattern, async_view(pattern.callback),
+                   pattern.default_args, pattern.name)
+        if pattern.name in ASYNC_ROUTES else pattern
+        for pattern in patterns
+    ]
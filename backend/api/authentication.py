@@ -0,0 +1,74 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework.authentication import TokenAuthentication
+
+from api.cache import bump_version, get_version
+from core import constants
+
+
+AUTH_KEY = 'auth:{key}'
+AUTH_VERSION = 'auth-{user}'
+
+
+def field_values(instance):
+    return tuple(getattr(instance, field.attname)
+                 for field in instance._meta.concrete_fields)
+
+
+def from_values(model, values):
+    '''Fresh instance of the model for every request,
+    so that concurrent requests never share a mutable user'''
+    return model.from_db(
+        'default', [field.attname for field in model._meta.concrete_fields],
+        values)
+
+
+class CachingTokenAuthentication(TokenAuthentication):
+    '''Token authentication with the token -> user lookup kept
+    in a short-lived local LRU and in the shared cache,
+    invalidated by the version bump of the token owner'''
+
+    _lock = threading.Lock()
+    _local = OrderedDict()
+
+    def authenticate_credentials(self, key):
+        now = time.monotonic()
+        with self._lock:
+            local = self._local.get(key)
+        entry = local[1] if local is not None and local[0] > now else None
+        if entry is None:
+            entry = cache.get(AUTH_KEY.format(key=key))
+        if entry is not None:
+            user_id, version = entry[:2]
+            if version != get_version(AUTH_VERSION.format(user=user_id)):
+                entry = None
+        if entry is None:
+            user, token = super().authenticate_credentials(key)
+            version = get_version(AUTH_VERSION.format(user=user.id))
+            entry = (user.id, version, field_values(token), field_values(user))
+            cache.set(AUTH_KEY.format(key=key), entry,
+                      timeout=constants.AUTH_CACHE_TIMEOUT)
+        with self._lock:
+            if local is None or local[1] is not entry:
+                local = (now + constants.AUTH_CACHE_TIMEOUT, entry)
+            self._local[key] = local
+            self._local.move_to_end(key)
+            while len(self._local) > constants.AUTH_CACHE_SIZE:
+                self._local.popitem(last=False)
+        user_id, version, token_values, user_values = entry
+        user = from_values(get_user_model(), user_values)
+        token = from_values(self.get_model(), token_values)
+        token.user = user
+        return user, token
+
+
+def invalidate_tokens(user_id):
+    '''Drop the cached token lookups of one user once the change
+    is committed'''
+    transaction.on_commit(
+        lambda: bump_version(AUTH_VERSION.format(user=user_id)))
@@ -0,0 +1,198 @@
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+from api.renderers import FastJSONRenderer
+from core import constants
+
+
+PROCESS_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+VERSION_KEY = 'version:{name}'
+MODIFIED_KEY = 'modified:{name}'
+REFERENCE_KEY = 'reference:{name}:{version}'
+RESPONSE_KEY = 'response:{name}:{version}:{viewer}:{path}'
+
+
+def check_shared_cache():
+    '''The version bumps of one worker must reach the others'''
+    backend = settings.CACHES['default']['BACKEND']
+    if settings.WEB_CONCURRENCY > 1 and backend in PROCESS_CACHES:
+        raise ImproperlyConfigured(
+            f'{settings.WEB_CONCURRENCY} workers cannot share {backend}: '
+            f'set CACHE_LOCATION to the memcached server')
+
+
+def get_version(name):
+    '''Current version of the named data shared by all workers'''
+    key = VERSION_KEY.format(name=name)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(name):
+    '''Invalidate the named data on every worker'''
+    key = VERSION_KEY.format(name=name)
+    set_modified(name)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        version = time.time_ns()
+        cache.set(key, version, timeout=None)
+        return version
+
+
+def set_modified(name):
+    '''Time a change of the named data which keeps its version'''
+    cache.set(MODIFIED_KEY.format(name=name), int(time.time()), timeout=None)
+
+
+def get_modified(name):
+    '''Time of the last version bump of the named data'''
+    key = MODIFIED_KEY.format(name=name)
+    modified = cache.get(key)
+    if modified is None:
+        cache.add(key, int(time.time()), timeout=None)
+        modified = cache.get(key)
+    return modified
+
+
+class ReferenceDataCache:
+    '''Rendered reference data kept in process memory
+    and in the shared cache, invalidated by the version bump'''
+
+    def __init__(self, name, get_data):
+        self.name = name
+        self.get_data = get_data
+        self._lock = threading.Lock()
+        self._local = None
+
+    def get(self):
+        '''return (content, etag) of the current version'''
+        version = get_version(self.name)
+        local = self._local
+        if local is not None and local[0] == version:
+            return local[1:]
+        with self._lock:
+            key = REFERENCE_KEY.format(name=self.name, version=version)
+            content = cache.get(key)
+            if content is None:
+                content = FastJSONRenderer().render(self.get_data())
+                cache.set(key, content,
+                          timeout=constants.REFERENCE_CACHE_TIMEOUT)
+            self._local = (version, content, f'"{self.name}-{version}"')
+        return self._local[1:]
+
+    def response(self, request):
+        content, etag = self.get()
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(content, content_type='application/json')
+        response['ETag'] = etag
+        return response
+
+
+class ReferenceDataListMixin:
+    '''Serve the unfiltered list from the reference data cache'''
+    reference_cache = None
+
+    def list(self, request, *args, **kwargs):
+        if self.reference_cache is None or request.query_params:
+            return super().list(request, *args, **kwargs)
+        return self.reference_cache.response(request)
+
+
+class ResponseCacheMixin:
+    '''Serve the cached data of the cacheable actions
+    with ETag/Last-Modified of the named data version.
+
+    The fields which change too often to bump the version are refreshed
+    over the cached data by `refresh_cached_data`, `get_fresh_tag` puts
+    them into the ETag and their changes are timed by `set_modified`
+    of `response_fresh_name`. The viewer specific data is told apart by
+    `get_viewer_key` and its changes are timed by `get_viewer_modified`.'''
+    response_cache_name = None
+    response_fresh_name = None
+    response_cache_actions = ('list', 'retrieve')
+
+    def cached_response(self, request, get_response):
+        name = self.response_cache_name
+        version = get_version(name)
+        viewer = self.get_viewer_key(request)
+        path = hashlib.md5(
+            f'{request.get_host()}{request.get_full_path()}'.encode()
+        ).hexdigest()
+        key = RESPONSE_KEY.format(name=name, version=version, viewer=viewer,
+                                  path=path)
+        data = cache.get(key)
+        if data is None:
+            response = get_response()
+            if response.status_code != 200:
+                return response
+            cache.set(key, response.data,
+                      timeout=constants.RESPONSE_CACHE_TIMEOUT)
+        else:
+            self.refresh_cached_data(data)
+            response = Response(data)
+        fresh_tag = self.get_fresh_tag(response.data)
+        etag = f'"{name}-{version}-{viewer}{fresh_tag}"'
+        last_modified = get_modified(name)
+        if self.response_fresh_name is not None:
+            last_modified = max(last_modified,
+                                get_modified(self.response_fresh_name))
+        viewer_modified = self.get_viewer_modified(request)
+        if viewer_modified is not None:
+            last_modified = max(last_modified, viewer_modified)
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified) or response
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        patch_vary_headers(response, ('Authorization',))
+        return response
+
+    def refresh_cached_data(self, data):
+        '''update the fresh fields of the data taken from the cache'''
+
+    def get_fresh_tag(self, data):
+        '''part of the ETag which follows the fresh fields'''
+        return ''
+
+    def get_viewer_key(self, request):
+        '''part of the key which tells apart the viewer specific data'''
+        if request.user.is_authenticated:
+            return str(request.user.id)
+        return 'anonymous'
+
+    def get_viewer_modified(self, request):
+        '''time of the last change of the viewer specific data'''
+        return None
+
+    def list(self, request, *args, **kwargs):
+        if self.response_cache_name is None or (
+                'list' not in self.response_cache_actions):
+            return super().list(request, *args, **kwargs)
+        return self.cached_response(
+            request, lambda: super(ResponseCacheMixin, self).list(
+                request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        if self.response_cache_name is None or (
+                'retrieve' not in self.response_cache_actions):
+            return super().retrieve(request, *args, **kwargs)
+        return self.cached_response(
+            request, lambda: super(ResponseCacheMixin, self).retrieve(
+                request, *args, **kwargs))
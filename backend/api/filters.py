@@ -2,6 +2,7 @@ from django_filters import rest_framework as filters
 from rest_framework.filters import SearchFilter
 
 from recipes.models import RecipeList
+from recipes.search import search_recipes
 
 
 class IngredientFilter(SearchFilter):
@@ -18,6 +19,7 @@ class RecipeFilter(filters.FilterSet):
     is_in_shopping_cart = filters.BooleanFilter(
         field_name='is_in_shopping_cart',
         method='filter_in_shopping_cart')
+    search = filters.CharFilter(method='filter_search')
 
     class Meta:
         model = RecipeList
@@ -32,3 +34,8 @@ class RecipeFilter(filters.FilterSet):
         if value and self.request.user.is_authenticated:
             return queryset.filter(shopping_cart__user=self.request.user)
         return queryset
+
+    def filter_search(self, queryset, name, value):
+        if value.strip():
+            return search_recipes(queryset, value.strip())
+        return queryset
@@ -0,0 +1,126 @@
+import base64
+import binascii
+import hashlib
+import io
+import logging
+import os
+import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.db import transaction
+from PIL import Image, features
+from rest_framework import serializers
+
+from api.cache import bump_version
+from core import constants
+
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_FORMAT, THUMBNAIL_EXTENSION = (
+    ('WEBP', 'webp') if features.check('webp') else ('JPEG', 'jpg'))
+
+DATA_URL = re.compile(r'data:image/(?P<ext>[\w.+-]+);base64,')
+
+executor = ThreadPoolExecutor(
+    max_workers=constants.THUMBNAIL_WORKERS,
+    thread_name_prefix='thumbnails',
+)
+
+
+def check_dimensions(file):
+    '''check the image size by its header,
+    return False if the data is not enough to read it'''
+    try:
+        with Image.open(file) as image:
+            width, height = image.size
+    except (OSError, EOFError, SyntaxError):
+        return False
+    if max(width, height) > constants.MAX_IMAGE_DIMENSION:
+        raise serializers.ValidationError(
+            f'The image should not be larger than '
+            f'{constants.MAX_IMAGE_DIMENSION} pixels.'
+        )
+    return True
+
+
+def decode_image(data):
+    '''Decode a base64 data url in chunks into a file named by its hash'''
+    match = DATA_URL.match(data)
+    if match is None:
+        raise serializers.ValidationError('Incorrect base64 image.')
+    ext = match['ext'].lower()
+    encoded = data[match.end():]
+    if len(encoded) // 4 * 3 > constants.MAX_IMAGE_SIZE:
+        raise serializers.ValidationError(
+            f'The image should not be larger than '
+            f'{constants.MAX_IMAGE_SIZE // 2 ** 20} MB.'
+        )
+    file = tempfile.SpooledTemporaryFile(
+        max_size=constants.IMAGE_SPOOL_SIZE)
+    digest = hashlib.sha256()
+    header = b''
+    checked = False
+    try:
+        for start in range(0, len(encoded), constants.IMAGE_DECODE_CHUNK):
+            chunk = base64.b64decode(
+                encoded[start:start + constants.IMAGE_DECODE_CHUNK])
+            digest.update(chunk)
+            file.write(chunk)
+            if not checked and len(header) < constants.IMAGE_SPOOL_SIZE:
+                header += chunk
+                checked = check_dimensions(io.BytesIO(header))
+    except binascii.Error:
+        raise serializers.ValidationError('Incorrect base64 image.')
+    file.seek(0)
+    if not checked:
+        check_dimensions(file)
+        file.seek(0)
+    return File(file, name=f'{digest.hexdigest()}.{ext}')
+
+
+def thumbnail_name(name, size):
+    return f'{os.path.splitext(name)[0]}_{size}.{THUMBNAIL_EXTENSION}'
+
+
+def make_thumbnails(storage, name):
+    '''save the missing thumbnails of the image'''
+    sizes = [size for size in constants.THUMBNAIL_SIZES
+             if not storage.exists(thumbnail_name(name, size))]
+    if not sizes:
+        return
+    try:
+        with storage.open(name) as file, Image.open(file) as image:
+            if image.mode not in ('RGB', 'RGBA') or THUMBNAIL_FORMAT == 'JPEG':
+                image = image.convert('RGB')
+            for size in sizes:
+                thumbnail = image.copy()
+                thumbnail.thumbnail((size, size))
+                buffer = io.BytesIO()
+                thumbnail.save(buffer, THUMBNAIL_FORMAT,
+                               quality=constants.THUMBNAIL_QUALITY)
+                storage.save(thumbnail_name(name, size),
+                             ContentFile(buffer.getvalue()))
+    except Exception:
+        logger.exception('Thumbnails of %s were not created', name)
+    else:
+        bump_version('recipes')
+
+
+def schedule_thumbnails(image):
+    '''create thumbnails in the background after the commit'''
+    if image:
+        storage, name = image.storage, image.name
+        transaction.on_commit(
+            lambda: executor.submit(make_thumbnails, storage, name))
+
+
+def thumbnail_url(image, size):
+    '''url of the thumbnail or None if it is not ready'''
+    name = thumbnail_name(image.name, size)
+    if image.storage.exists(name):
+        return image.storage.url(name)
+    return None
@@ -0,0 +1,156 @@
+import json
+import platform
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes.models import Ingredient, RecipeList, Tag
+from users.models import Subscribe
+
+
+def percentile(values, percent):
+    '''nearest-rank percentile of the sorted values'''
+    index = max(0, round(percent / 100 * len(values)) - 1)
+    return values[min(index, len(values) - 1)]
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ('git', 'rev-parse', 'HEAD'), cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = ('Measure latency, queries and memory of the API hot paths '
+            'in process and write the results as json')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument('--output', default='benchmark.json',
+                            help='path of the json results')
+        parser.add_argument('--scenario', action='append',
+                            help='run only these scenarios')
+        parser.add_argument('--warm-cache', action='store_true',
+                            help='keep the caches between the iterations')
+
+    def scenarios(self):
+        '''name -> (url, authenticated)'''
+        recipe = RecipeList.objects.order_by('-favorites_count').first()
+        tag = Tag.objects.order_by('id').first()
+        ingredient = Ingredient.objects.order_by('id').first()
+        word = recipe.name.split()[0]
+        return {
+            'recipes_list_anonymous': ('/api/recipes/', False),
+            'recipes_list': ('/api/recipes/', True),
+            'recipes_list_cursor': ('/api/recipes/?pagination=cursor', True),
+            'recipe_detail': (f'/api/recipes/{recipe.id}/', True),
+            'recipes_filter_tags': (f'/api/recipes/?tags={tag.slug}', True),
+            'recipes_filter_favorited': (
+                '/api/recipes/?is_favorited=1', True),
+            'recipes_filter_cart': (
+                '/api/recipes/?is_in_shopping_cart=1', True),
+            'recipes_search': (f'/api/recipes/?search={word}', True),
+            'subscriptions': (
+                '/api/users/subscriptions/?recipes_limit=3', True),
+            'ingredients_search': (
+                f'/api/ingredients/?name={ingredient.name[:3]}', False),
+            'download_shopping_cart': (
+                '/api/recipes/download_shopping_cart/', True),
+        }
+
+    def heavy_user(self):
+        '''the user with the most subscriptions'''
+        row = Subscribe.objects.values('user').annotate(
+            count=Count('id')).order_by('-count').first()
+        if row is None:
+            raise CommandError('Run generate_data first')
+        token, _ = Token.objects.get_or_create(user_id=row['user'])
+        return token
+
+    def measure(self, client, url, iterations, warmup, warm_cache):
+        for _ in range(warmup):
+            client.get(url)
+        timings, queries = [], []
+        for _ in range(iterations):
+            if not warm_cache:
+                cache.clear()
+            with CaptureQueriesContext(connection) as context:
+                start = time.perf_counter()
+                response = client.get(url)
+                content = b''.join(response) if response.streaming else (
+                    response.content)
+                timings.append(time.perf_counter() - start)
+            queries.append(len(context.captured_queries))
+        if not warm_cache:
+            cache.clear()
+        tracemalloc.start()
+        client.get(url)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        timings.sort()
+        return {
+            'status': response.status_code,
+            'iterations': iterations,
+            'mean_ms': sum(timings) / len(timings) * 1000,
+            'p50_ms': percentile(timings, 50) * 1000,
+            'p90_ms': percentile(timings, 90) * 1000,
+            'p99_ms': percentile(timings, 99) * 1000,
+            'queries': max(queries),
+            'peak_memory_kb': peak / 1024,
+            'response_bytes': len(content),
+        }
+
+    def handle(self, *args, **options):
+        if not RecipeList.objects.exists():
+            raise CommandError('Run generate_data first')
+        token = self.heavy_user()
+        clients = {False: APIClient(), True: APIClient()}
+        clients[True].credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        scenarios = self.scenarios()
+        names = options['scenario'] or list(scenarios)
+        unknown = set(names) - set(scenarios)
+        if unknown:
+            raise CommandError(f'Unknown scenarios: {sorted(unknown)}')
+        results = {}
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            for name in names:
+                url, authenticated = scenarios[name]
+                results[name] = self.measure(
+                    clients[authenticated], url, options['iterations'],
+                    options['warmup'], options['warm_cache'])
+                self.stdout.write(
+                    f'{name}: p50 {results[name]["p50_ms"]:.1f} ms, '
+                    f'p99 {results[name]["p99_ms"]:.1f} ms, '
+                    f'{results[name]["queries"]} queries')
+        report = {
+            'commit': git_commit(),
+            'created': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'database': connection.vendor,
+            'warm_cache': options['warm_cache'],
+            'data': {
+                'recipes': RecipeList.objects.count(),
+                'ingredients': Ingredient.objects.count(),
+                'subscriptions': Subscribe.objects.count(),
+            },
+            'scenarios': results,
+        }
+        with open(options['output'], 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+        self.stdout.write(self.style.SUCCESS(
+            f'Results are written to {options["output"]}'))
@@ -0,0 +1,107 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+from wsgiref.util import setup_testing_defaults
+
+from django.conf import settings
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand
+from django.core.wsgi import get_wsgi_application
+from django.test.utils import override_settings
+
+
+class Command(BaseCommand):
+    help = ('Compare the throughput of the ASGI and WSGI deployments '
+            'with concurrent slow clients in process')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='/api/recipes/')
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, default=50,
+                            help='simultaneous clients')
+        parser.add_argument('--workers', type=int, default=4,
+                            help='sync workers of the WSGI deployment')
+        parser.add_argument('--client-delay', type=float, default=0.05,
+                            help='seconds a slow client takes per chunk')
+        parser.add_argument('--token', help='auth token of the client')
+
+    def handle(self, *args, **options):
+        if not settings.ASYNC_VIEWS:
+            self.stderr.write('ASYNC_VIEWS is off, the ASGI deployment '
+                              'runs the sync views')
+        path, query = (options['path'].split('?', 1) + [''])[:2]
+        path, query = quote(path), quote(query, safe='=&')
+        with override_settings(ALLOWED_HOSTS=['localhost']):
+            results = {
+                'wsgi': self.run_wsgi(path, query, options),
+                'asgi': asyncio.run(self.run_asgi(path, query, options)),
+            }
+        for title, (seconds, statuses) in results.items():
+            self.stdout.write(
+                f'{title}: {options["requests"] / seconds:.1f} requests/s, '
+                f'{seconds:.2f} s, statuses {sorted(statuses)}')
+
+    def run_wsgi(self, path, query, options):
+        '''every worker is busy until its client reads the response'''
+        application = get_wsgi_application()
+        delay = options['client_delay']
+        statuses = set()
+
+        def start_response(status, headers, exc_info=None):
+            statuses.add(int(status.split()[0]))
+
+        def request(_):
+            environ = {'PATH_INFO': path, 'QUERY_STRING': query,
+                       'HTTP_HOST': 'localhost'}
+            if options['token']:
+                environ['HTTP_AUTHORIZATION'] = f'Token {options["token"]}'
+            setup_testing_defaults(environ)
+            body = application(environ, start_response)
+            try:
+                for _ in body:
+                    time.sleep(delay)
+            finally:
+                if hasattr(body, 'close'):
+                    body.close()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(options['workers']) as executor:
+            list(executor.map(request, range(options['requests'])))
+        return time.perf_counter() - start, statuses
+
+    async def run_asgi(self, path, query, options):
+        '''the event loop sends the responses to the slow clients'''
+        application = get_asgi_application()
+        delay = options['client_delay']
+        semaphore = asyncio.Semaphore(options['concurrency'])
+        statuses = set()
+        headers = [(b'host', b'localhost')]
+        if options['token']:
+            headers.append(
+                (b'authorization', f'Token {options["token"]}'.encode()))
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                statuses.add(message['status'])
+            elif message['type'] == 'http.response.body':
+                await asyncio.sleep(delay)
+
+        async def request():
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'},
+                'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+                'path': path, 'raw_path': path.encode(), 'root_path': '',
+                'query_string': query.encode(),
+                'headers': headers,
+                'client': ('127.0.0.1', 0), 'server': ('localhost', 80),
+            }
+            async with semaphore:
+                await application(scope, receive, send)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(request() for _ in range(options['requests'])))
+        return time.perf_counter() - start, statuses
@@ -0,0 +1,37 @@
+import timeit
+
+from django.core.management.base import BaseCommand
+
+from api.search import ingredient_index
+from recipes.models import Ingredient
+
+
+class Command(BaseCommand):
+    help = 'Compare ingredient search in memory with the database search'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--number', type=int, default=200,
+                            help='searches per query')
+
+    def handle(self, *args, **options):
+        number = options['number']
+        names = list(Ingredient.objects.values_list('name', flat=True)[:20])
+        if not names:
+            self.stderr.write('Import ingredients first')
+            return
+        queries = sorted({name[:length] for name in names
+                          for length in (1, 3, 5)})
+        ingredient_index.load()
+        results = {
+            'database': lambda query: list(Ingredient.objects.filter(
+                name__istartswith=query).values(
+                    'id', 'name', 'measurement_unit')),
+            'index': ingredient_index.search,
+        }
+        for title, search in results.items():
+            seconds = timeit.timeit(
+                lambda: [search(query) for query in queries],
+                number=number,
+            )
+            per_search = seconds / (number * len(queries)) * 1e6
+            self.stdout.write(f'{title}: {per_search:.1f} us per search')
@@ -0,0 +1,44 @@
+import timeit
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api.renderers import FastJSONRenderer
+from api.representations import RecipeReadSerializer
+from recipes.models import RecipeList
+
+
+class Command(BaseCommand):
+    help = 'Compare rendering of recipe pages by the DRF and fast renderers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, default=50,
+                            help='recipes per page')
+        parser.add_argument('--number', type=int, default=200,
+                            help='renders per renderer')
+
+    def handle(self, *args, **options):
+        request = Request(APIRequestFactory().get('/api/recipes/'))
+        recipes = RecipeList.objects.with_related()[:options['page_size']]
+        data = RecipeReadSerializer(
+            recipes, many=True, context={'request': request}).data
+        if not data:
+            self.stderr.write('Create recipes first')
+            return
+        renderers = {
+            'drf': JSONRenderer(),
+            'fast': FastJSONRenderer(),
+        }
+        payloads = {title: renderer.render(data)
+                    for title, renderer in renderers.items()}
+        if payloads['drf'] != payloads['fast']:
+            self.stderr.write('Payloads of the renderers differ')
+        number = options['number']
+        for title, renderer in renderers.items():
+            seconds = timeit.timeit(lambda: renderer.render(data),
+                                    number=number)
+            self.stdout.write(
+                f'{title}: {seconds / number * 1e3:.3f} ms per page '
+                f'of {len(data)} recipes, {len(payloads[title])} bytes')
@@ -0,0 +1,122 @@
+import threading
+from array import array
+from bisect import bisect_left, insort
+from collections import Counter, namedtuple
+
+from django.db import transaction
+
+from api.cache import bump_version, get_version
+from recipes.models import IngredientInRecipe, RecipeList
+
+
+RecipeIndex = namedtuple('RecipeIndex', ('version', 'postings', 'recipes'))
+
+
+class RecipeMatcher:
+    '''Inverted index from an ingredient to the sorted ids of recipes.
+    The index is an immutable snapshot which is replaced as a whole,
+    so matching reads it without the lock'''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._index = None
+
+    def load(self):
+        '''current snapshot, rebuilt if recipes were changed elsewhere'''
+        version = get_version('recipe-ingredients')
+        index = self._index
+        if index is not None and index.version == version:
+            return index
+        with self._lock:
+            index = self._index
+            if index is None or index.version != version:
+                index = self._index = self.build(version)
+            return index
+
+    @staticmethod
+    def build(version):
+        recipes = {
+            recipe_id: ([], cooking_time, set())
+            for recipe_id, cooking_time in RecipeList.objects.order_by(
+            ).values_list('id', 'cooking_time').iterator()
+        }
+        postings = {}
+        ingredients = IngredientInRecipe.objects.order_by(
+            'recipe_id').values_list('recipe_id', 'ingredient_id')
+        for recipe_id, ingredient_id in ingredients.iterator():
+            if recipe_id in recipes:
+                recipes[recipe_id][0].append(ingredient_id)
+                postings.setdefault(
+                    ingredient_id, array('q')).append(recipe_id)
+        tags = RecipeList.tags.through.objects.values_list(
+            'recipelist_id', 'tag_id')
+        for recipe_id, tag_id in tags.iterator():
+            if recipe_id in recipes:
+                recipes[recipe_id][2].add(tag_id)
+        return RecipeIndex(version, postings, {
+            recipe_id: (frozenset(ingredients), cooking_time,
+                        frozenset(tags))
+            for recipe_id, (ingredients, cooking_time, tags)
+            in recipes.items()
+        })
+
+    def update_recipe(self, recipe):
+        '''apply changes of one recipe to a copy of the current index,
+        without a current index only the version is bumped for the others
+        and a stale index is left to be rebuilt by the next match'''
+        index = self._index
+        if index is None or index.version != get_version(
+                'recipe-ingredients'):
+            bump_version('recipe-ingredients')
+            return
+        ingredients = frozenset(recipe.recipe_ingredients.values_list(
+            'ingredient_id', flat=True))
+        tags = frozenset(recipe.tags.values_list('id', flat=True))
+        version = bump_version('recipe-ingredients')
+        with self._lock:
+            index = self._index
+            if index is None or index.version + 1 != version:
+                return
+            postings = dict(index.postings)
+            recipes = dict(index.recipes)
+            old = recipes.pop(recipe.id, None)
+            old_ingredients = old[0] if old is not None else frozenset()
+            for ingredient_id in old_ingredients - ingredients:
+                posting = array('q', postings[ingredient_id])
+                position = bisect_left(posting, recipe.id)
+                if (position < len(posting)
+                        and posting[position] == recipe.id):
+                    del posting[position]
+                postings[ingredient_id] = posting
+            for ingredient_id in ingredients - old_ingredients:
+                posting = array('q', postings.get(ingredient_id, ()))
+                insort(posting, recipe.id)
+                postings[ingredient_id] = posting
+            recipes[recipe.id] = (ingredients, recipe.cooking_time, tags)
+            self._index = RecipeIndex(version, postings, recipes)
+
+    def schedule_update(self, recipe):
+        transaction.on_commit(lambda: self.update_recipe(recipe))
+
+    def match(self, ingredient_ids, tag_ids=None, max_cooking_time=None):
+        '''(recipe id, matched, missing) of recipes using the ingredients,
+        the recipes with fewer missing and more matched ingredients first'''
+        _, postings, recipes = self.load()
+        counts = Counter()
+        for ingredient_id in set(ingredient_ids):
+            counts.update(postings.get(ingredient_id, ()))
+        result = []
+        for recipe_id, matched in counts.items():
+            ingredients, cooking_time, tags = recipes[recipe_id]
+            if max_cooking_time is not None and (
+                    cooking_time > max_cooking_time):
+                continue
+            if tag_ids and tags.isdisjoint(tag_ids):
+                continue
+            result.append((len(ingredients) - matched, -matched, recipe_id))
+        result.sort()
+        return [(recipe_id, -matched, missing)
+                for missing, matched, recipe_id in result]
+
+
+recipe_matcher = RecipeMatcher()
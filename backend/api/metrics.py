@@ -0,0 +1,266 @@
+import contextvars
+import logging
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse
+from rest_framework import serializers
+
+from core import constants
+from core.db.stats import stats as db_stats
+
+
+logger = logging.getLogger(__name__)
+
+current_request = contextvars.ContextVar('current_request', default=None)
+
+
+class RequestMetrics:
+    '''Timings of one sampled request'''
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.serialize_time = 0.0
+        self.serializing = False
+        self.render_time = 0.0
+        self.queries = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        '''execute_wrapper of the database connections'''
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - start
+            self.sql_count += 1
+            self.queries[sql] += 1
+
+    def duplicates(self):
+        '''the most repeated query if it repeats above the threshold'''
+        if not self.queries:
+            return None
+        sql, count = self.queries.most_common(1)[0]
+        if count < constants.METRICS_DUPLICATE_QUERIES:
+            return None
+        return sql, count
+
+
+def execute_sampled(execute, sql, params, many, context):
+    '''execute_wrapper which counts the query
+    for the sampled request of the current context'''
+    metrics = current_request.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    return metrics(execute, sql, params, many, context)
+
+
+def instrument(connection):
+    '''Count the queries of the connection for the sampled requests,
+    the sync views run in the threads of the async stack get
+    the request of their context as well'''
+    if execute_sampled not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, execute_sampled)
+
+
+@contextmanager
+def timed_serialize():
+    '''Add the time of the block to the serialize time of the request,
+    the serializers nested in it are not counted again'''
+    metrics = current_request.get()
+    if metrics is None or metrics.serializing:
+        yield
+        return
+    metrics.serializing = True
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.serializing = False
+        metrics.serialize_time += time.perf_counter() - start
+
+
+class TimedSerializerMixin:
+    '''Count building of `data` as the serialize time of the request'''
+
+    @property
+    def data(self):
+        with timed_serialize():
+            return super().data
+
+
+class TimedListSerializer(TimedSerializerMixin, serializers.ListSerializer):
+    '''`many=True` serializer of the timed serializers'''
+
+
+@contextmanager
+def timed_render():
+    '''Add the time of the block to the render time of the request'''
+    metrics = current_request.get()
+    if metrics is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.render_time += time.perf_counter() - start
+
+
+class MetricsRegistry:
+    '''Per view totals of the sampled requests of this worker'''
+    fields = (
+        ('requests_total', 'Sampled requests'),
+        ('request_seconds_total', 'Time spent on requests'),
+        ('sql_queries_total', 'SQL queries executed'),
+        ('sql_seconds_total', 'Time spent in SQL queries'),
+        ('serialize_seconds_total', 'Time spent serializing responses'),
+        ('render_seconds_total', 'Time spent rendering responses'),
+        ('response_bytes_total', 'Size of the responses'),
+    )
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = defaultdict(lambda: [0] * len(self.fields))
+        self.collectors = []
+
+    def add(self, view, values):
+        with self._lock:
+            totals = self._views[view]
+            for index, value in enumerate(values):
+                totals[index] += value
+
+    def render(self):
+        '''Prometheus text exposition format'''
+        with self._lock:
+            views = {view: list(totals)
+                     for view, totals in self._views.items()}
+        lines = []
+        for index, (name, help_text) in enumerate(self.fields):
+            lines.append(f'# HELP foodgram_{name} {help_text}')
+            lines.append(f'# TYPE foodgram_{name} counter')
+            for view, totals in sorted(views.items()):
+                lines.append(
+                    f'foodgram_{name}{{view="{view}"}} {totals[index]}')
+        for collector in self.collectors:
+            lines.extend(collector())
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+def connection_metrics():
+    '''Connection counters and pool gauges of this worker'''
+    values = db_stats.snapshot()
+    lines = []
+    for name, help_text in db_stats.counters:
+        lines.append(f'# HELP foodgram_db_{name}_total {help_text}')
+        lines.append(f'# TYPE foodgram_db_{name}_total counter')
+        for alias, counter in sorted(values.items()):
+            lines.append(f'foodgram_db_{name}_total{{database="{alias}"}} '
+                         f'{counter[name]}')
+    pools = {alias: pool.state()
+             for alias, pool in sorted(db_stats.pools.items())}
+    for index, (name, help_text) in enumerate((
+        ('pool_size', 'Connections the pool may open'),
+        ('pool_in_use', 'Pooled connections in use'),
+        ('pool_idle', 'Pooled connections waiting for reuse'),
+        ('pool_waiting', 'Threads waiting for a free pool slot'),
+    )):
+        lines.append(f'# HELP foodgram_db_{name} {help_text}')
+        lines.append(f'# TYPE foodgram_db_{name} gauge')
+        for alias, state in pools.items():
+            lines.append(
+                f'foodgram_db_{name}{{database="{alias}"}} {state[index]}')
+    return lines
+
+
+registry.collectors.append(connection_metrics)
+
+
+def view_name(request):
+    '''`ViewSet.action` of the resolved DRF view, the view name otherwise'''
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    view_class = getattr(match.func, 'cls', None)
+    if view_class is None:
+        return match.view_name or match.func.__name__
+    actions = getattr(match.func, 'actions', None) or {}
+    action = actions.get(request.method.lower(), request.method.lower())
+    return f'{view_class.__name__}.{action}'
+
+
+class MetricsMiddleware:
+    '''Record time, SQL, serialize and render time of the sampled requests'''
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def sample(self):
+        sample_rate = settings.METRICS_SAMPLE_RATE
+        if not sample_rate or random.random() >= sample_rate:
+            return None
+        return RequestMetrics()
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        metrics = self.sample()
+        if metrics is None:
+            return self.get_response(request)
+        token = current_request.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_request.reset(token)
+        return self.record(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics = self.sample()
+        if metrics is None:
+            return await self.get_response(request)
+        token = current_request.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_request.reset(token)
+        return self.record(request, response, metrics)
+
+    def record(self, request, response, metrics):
+        total = time.perf_counter() - metrics.start
+        view = view_name(request)
+        size = 0 if response.streaming else len(response.content)
+        registry.add(view, (1, total, metrics.sql_count, metrics.sql_time,
+                            metrics.serialize_time, metrics.render_time,
+                            size))
+        duplicates = metrics.duplicates()
+        if duplicates is not None:
+            logger.warning('%s repeats a query %d times: %s',
+                           view, duplicates[1], duplicates[0])
+        response['Server-Timing'] = ', '.join((
+            f'total;dur={total * 1000:.1f}',
+            f'db;dur={metrics.sql_time * 1000:.1f};'
+            f'desc="{metrics.sql_count} queries"',
+            f'serialize;dur={metrics.serialize_time * 1000:.1f}',
+            f'render;dur={metrics.render_time * 1000:.1f}',
+        ))
+        return response
+
+
+def metrics_view(request):
+    '''Metrics of this worker for Prometheus'''
+    return HttpResponse(registry.render(),
+                        content_type='text/plain; version=0.0.4')
@@ -1,9 +1,77 @@
-from rest_framework.pagination import PageNumberPagination
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import QuerySet
+from django.utils.functional import cached_property
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 
 from core import constants
 
 
+class ApproximateCountPaginator(Paginator):
+    '''Takes the count of a large unfiltered table from the planner stats'''
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if (isinstance(queryset, QuerySet)
+                and connections[queryset.db].vendor == 'postgresql'
+                and not queryset.query.where):
+            with connections[queryset.db].cursor() as cursor:
+                cursor.execute(
+                    'SELECT reltuples::bigint FROM pg_class '
+                    'WHERE oid = %s::regclass',
+                    [queryset.model._meta.db_table],
+                )
+                row = cursor.fetchone()
+            if row and row[0] > constants.APPROXIMATE_COUNT_THRESHOLD:
+                return row[0]
+        return super().count
+
+
 class LimitPageNumberPagination(PageNumberPagination):
     '''Show 6 recipes'''
     page_size = constants.DEFAULT_PAGE_SIZE
     page_size_query_param = 'limit'
+    django_paginator_class = ApproximateCountPaginator
+
+
+class RecipeCursorPagination(CursorPagination):
+    '''Recipes from the newest without OFFSET and COUNT,
+    the search results ordered by rank are paged by numbers only'''
+    page_size = constants.DEFAULT_PAGE_SIZE
+    page_size_query_param = 'limit'
+    ordering = ('-pub_date', '-id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if request.query_params.get('search'):
+            raise ValidationError({'pagination': [
+                'Search results are ordered by rank and cannot be paged '
+                'by the cursor.']})
+        return super().paginate_queryset(queryset, request, view)
+
+
+class SubscribeCursorPagination(CursorPagination):
+    '''Subscriptions from the newest without OFFSET and COUNT'''
+    page_size = constants.DEFAULT_PAGE_SIZE
+    page_size_query_param = 'limit'
+    ordering = ('-id',)
+
+
+class CursorPaginationMixin:
+    '''Switch an action to the cursor pagination by `?pagination=cursor`'''
+    cursor_pagination_classes = {}
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            cursor_pagination_class = self.cursor_pagination_classes.get(
+                self.action)
+            params = self.request.query_params
+            if cursor_pagination_class and (
+                    params.get('pagination') == 'cursor'
+                    or 'cursor' in params):
+                self._paginator = cursor_pagination_class()
+            else:
+                return super().paginator
+        return self._paginator
@@ -0,0 +1,142 @@
+import zlib
+
+from rest_framework import serializers
+
+from api.images import thumbnail_url
+from api.metrics import TimedListSerializer, TimedSerializerMixin
+from api.viewer import get_viewer
+from core import constants
+from recipes.models import RecipeList
+
+
+FRESH_AUTHOR_FIELDS = ('email', 'username', 'first_name', 'last_name',
+                       'recipes_count', 'subscribers_count')
+
+
+def image_url(image, request=None, thumbnail=False):
+    '''url of the image the way Base64ImageField represents it'''
+    if not image:
+        return None
+    url = None
+    if thumbnail:
+        url = thumbnail_url(image, constants.LIST_THUMBNAIL_SIZE)
+    if url is None:
+        try:
+            url = image.url
+        except AttributeError:
+            return None
+    if request is not None:
+        return request.build_absolute_uri(url)
+    return url
+
+
+class RecipeReadSerializer(TimedSerializerMixin, serializers.BaseSerializer):
+    '''Read-only representation of RecipeSerializer
+    built from the recipe loaded by `with_related`'''
+
+    class Meta:
+        list_serializer_class = TimedListSerializer
+
+    def to_representation(self, recipe):
+        request = self.context.get('request')
+        view = self.context.get('view')
+        viewer = get_viewer(request)
+        author = recipe.author
+        return {
+            'id': recipe.id,
+            'tags': [
+                {'id': tag.id, 'name': tag.name,
+                 'color': tag.color, 'slug': tag.slug}
+                for tag in recipe.tags.all()
+            ],
+            'author': {
+                'id': author.id,
+                'email': author.email,
+                'username': author.username,
+                'first_name': author.first_name,
+                'last_name': author.last_name,
+                'is_subscribed': viewer.is_subscribed(author.id),
+                'recipes_count': author.recipes_count,
+                'subscribers_count': author.subscribers_count,
+            },
+            'ingredients': [
+                {'id': item.ingredient.id,
+                 'name': item.ingredient.name,
+                 'measurement_unit': item.ingredient.measurement_unit,
+                 'amount': item.amount}
+                for item in recipe.recipe_ingredients.all()
+            ],
+            'name': recipe.name,
+            'image': image_url(
+                recipe.image, request,
+                thumbnail=getattr(view, 'action', None) == 'list'),
+            'text': recipe.text,
+            'cooking_time': recipe.cooking_time,
+            'is_favorited': viewer.is_favorited(recipe.id),
+            'is_in_shopping_cart': viewer.is_in_shopping_cart(recipe.id),
+            'favorites_count': recipe.favorites_count,
+        }
+
+
+def fresh_values(recipe):
+    '''fields of the recipe representation which change
+    without the 'recipes' version bump: counters and the author'''
+    author = recipe['author']
+    return (recipe['favorites_count'],
+            *(author[field] for field in FRESH_AUTHOR_FIELDS))
+
+
+def refresh_recipes(recipes):
+    '''put the current fresh fields into the cached
+    representations of RecipeReadSerializer'''
+    if not recipes:
+        return
+    rows = RecipeList.objects.filter(
+        id__in=[recipe['id'] for recipe in recipes]
+    ).values_list('id', 'favorites_count',
+                  *(f'author__{field}' for field in FRESH_AUTHOR_FIELDS))
+    fresh = {id: values for id, *values in rows}
+    for recipe in recipes:
+        values = fresh.get(recipe['id'])
+        if values is not None:
+            recipe['favorites_count'] = values[0]
+            recipe['author'].update(zip(FRESH_AUTHOR_FIELDS, values[1:]))
+
+
+def fresh_tag(recipes):
+    '''checksum of the fresh fields of the recipe representations'''
+    values = repr([fresh_values(recipe) for recipe in recipes])
+    return f'{zlib.crc32(values.encode()):08x}'
+
+
+class SubscribeReadSerializer(TimedSerializerMixin,
+                              serializers.BaseSerializer):
+    '''Read-only representation of SubscribeSerializer
+    built from the subscription with the prefetched author recipes'''
+
+    class Meta:
+        list_serializer_class = TimedListSerializer
+
+    def to_representation(self, subscribe):
+        author = subscribe.author
+        return {
+            'id': author.id,
+            'email': author.email,
+            'username': author.username,
+            'first_name': author.first_name,
+            'last_name': author.last_name,
+            'is_subscribed': True,
+            'recipes': [
+                {'id': recipe.id,
+                 'name': recipe.name,
+                 'image': image_url(recipe.image),
+                 'cooking_time': recipe.cooking_time}
+                for recipe in author.subscription_recipes
+            ],
+            'recipes_count': author.recipes_count,
+        }
+
+
+def ingredient_rows(queryset):
+    '''representation of IngredientSerializer straight from values()'''
+    return list(queryset.values('id', 'name', 'measurement_unit'))
@@ -0,0 +1,54 @@
+import threading
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+
+from api.cache import get_version
+from core import constants
+from recipes.models import Ingredient
+
+
+class IngredientIndex:
+    '''Sorted in-memory index of ingredient names for the autocomplete'''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._state = ([], [], '', [0])
+
+    def load(self):
+        '''(re)load ingredients if they were changed since the last load'''
+        version = get_version('ingredients')
+        if version == self._version:
+            return
+        with self._lock:
+            if version == self._version:
+                return
+            items = sorted(
+                Ingredient.objects.values(
+                    'id', 'name', 'measurement_unit').order_by(),
+                key=lambda item: (item['name'].lower(), item['id']),
+            )
+            keys = [item['name'].lower() for item in items]
+            offsets = [0, *accumulate(len(key) + 1 for key in keys)]
+            self._state = (keys, items, '\n'.join(keys), offsets)
+            self._version = version
+
+    def search(self, name, limit=constants.INGREDIENT_SEARCH_LIMIT):
+        '''ingredients which names start with `name`,
+        then ingredients which names contain it'''
+        self.load()
+        keys, items, text, offsets = self._state
+        name = name.strip().lower()
+        start = bisect_left(keys, name)
+        end = bisect_left(keys, name + '\U0010ffff', start)
+        result = items[start:min(end, start + limit)]
+        position = text.find(name) if name else -1
+        while position != -1 and len(result) < limit:
+            index = bisect_right(offsets, position) - 1
+            if not start <= index < end:
+                result.append(items[index])
+            position = text.find(name, offsets[index + 1])
+        return result
+
+
+ingredient_index = IngredientIndex()
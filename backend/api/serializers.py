@@ -1,17 +1,20 @@
 from django.contrib.auth import authenticate, get_user_model
 from django.contrib.auth.hashers import make_password
+from django.db import transaction
 from djoser.serializers import UserSerializer as UserHandleSerializer
 from rest_framework import serializers, validators
 from rest_framework.generics import get_object_or_404
 
+from api.matching import recipe_matcher
+from api.metrics import TimedListSerializer, TimedSerializerMixin
+from api.representations import RecipeReadSerializer
 from api.services import Base64ImageField
+from api.viewer import get_viewer
 from core import constants
 from recipes.models import (
     Ingredient,
     IngredientInRecipe,
-    FavoriteRecipe,
     RecipeList,
-    ShoppingCart,
     Tag,
 )
 from users.models import Subscribe
@@ -20,7 +23,7 @@ from users.models import Subscribe
 User = get_user_model()
 
 
-class UserSerializer(UserHandleSerializer):
+class UserSerializer(TimedSerializerMixin, UserHandleSerializer):
     '''processing of user data'''
     is_subscribed = serializers.SerializerMethodField()
 
@@ -28,15 +31,12 @@ class UserSerializer(UserHandleSerializer):
         model = User
         fields = ('id', 'email', 'username',
                   'first_name', 'last_name',
-                  'is_subscribed')
+                  'is_subscribed', 'recipes_count', 'subscribers_count')
+        list_serializer_class = TimedListSerializer
 
     def get_is_subscribed(self, obj):
         '''check of subsribe'''
-        user = self.context.get('request').user
-        if user.is_anonymous:
-            return False
-        return Subscribe.objects.filter(
-            user=user, author=obj.id).exists()
+        return get_viewer(self.context.get('request')).is_subscribed(obj.id)
 
 
 class UserPasswordSerializer(serializers.Serializer):
@@ -70,18 +70,21 @@ class UserPasswordSerializer(serializers.Serializer):
         return validated_data
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     '''Tag serializer'''
     class Meta:
         model = Tag
         fields = '__all__'
+        list_serializer_class = TimedListSerializer
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(TimedSerializerMixin,
+                           serializers.ModelSerializer):
     '''Ingredient serializer'''
     class Meta:
         model = Ingredient
         fields = '__all__'
+        list_serializer_class = TimedListSerializer
 
 
 class IngredientInRecipeSerializer(serializers.ModelSerializer):
@@ -102,7 +105,8 @@ class IngredientInRecipeSerializer(serializers.ModelSerializer):
         ]
 
 
-class FavoriteOrSubscribeSerializer(serializers.ModelSerializer):
+class FavoriteOrSubscribeSerializer(TimedSerializerMixin,
+                                    serializers.ModelSerializer):
     '''Serializer of favorite or subscribe'''
     image = Base64ImageField()
 
@@ -110,9 +114,27 @@ class FavoriteOrSubscribeSerializer(serializers.ModelSerializer):
         model = RecipeList
         fields = ('id', 'name', 'image', 'cooking_time')
         read_only_fields = ('id', 'name', 'image', 'cooking_time')
+        list_serializer_class = TimedListSerializer
+
+
+class RecipeBatchSerializer(serializers.Serializer):
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=constants.BATCH_MAX_SIZE,
+    )
+
+    def validate_recipes(self, value):
+        return list(dict.fromkeys(value))
+
+
+class RecipesLimitSerializer(serializers.Serializer):
+    '''`recipes_limit` query parameter of the subscriptions'''
+    recipes_limit = serializers.IntegerField(min_value=0, required=False)
 
 
-class SubscribeSerializer(serializers.ModelSerializer):
+class SubscribeSerializer(TimedSerializerMixin,
+                          serializers.ModelSerializer):
     '''Serializer of subscribers'''
     id = serializers.IntegerField(source='author.id')
     email = serializers.EmailField(source='author.email')
@@ -128,6 +150,7 @@ class SubscribeSerializer(serializers.ModelSerializer):
         fields = ('id', 'email', 'username', 'first_name', 'last_name',
                   'is_subscribed', 'recipes', 'recipes_count',)
         read_only_fields = ('is_subscribed', 'recipes_count',)
+        list_serializer_class = TimedListSerializer
 
     def validate(self, data):
         '''Validate of data'''
@@ -148,25 +171,29 @@ class SubscribeSerializer(serializers.ModelSerializer):
 
     def get_is_subscribed(self, obj):
         '''check of subscribe'''
+        if obj.pk is not None:
+            return True
         return Subscribe.objects.filter(
             user=obj.user, author=obj.author).exists()
 
     def get_recipes(self, obj):
         '''get recipes'''
-        request = self.context.get('request')
-        recipes_limit = request.GET.get('recipes_limit')
-        recipes = RecipeList.objects.filter(author=obj.author)
-        if recipes_limit:
-            recipes = recipes[:int(recipes_limit)]
+        if hasattr(obj.author, 'subscription_recipes'):
+            recipes = obj.author.subscription_recipes
+        else:
+            recipes_limit = self.context.get('recipes_limit')
+            recipes = RecipeList.objects.filter(author=obj.author)
+            if recipes_limit is not None:
+                recipes = recipes[:recipes_limit]
         serializer = FavoriteOrSubscribeSerializer(recipes, many=True)
         return serializer.data
 
     def get_recipes_count(self, obj):
         '''recipes count'''
-        return RecipeList.objects.filter(author=obj.author).count()
+        return obj.author.recipes_count
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class RecipeSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     '''Serializer of recipe'''
     tags = TagSerializer(
         read_only=True,
@@ -188,17 +215,44 @@ class RecipeSerializer(serializers.ModelSerializer):
         model = RecipeList
         fields = ('id', 'tags', 'author', 'ingredients',
                   'name', 'image', 'text', 'cooking_time',
-                  'is_favorited', 'is_in_shopping_cart')
+                  'is_favorited', 'is_in_shopping_cart', 'favorites_count')
+        list_serializer_class = TimedListSerializer
 
     @staticmethod
-    def __create_ingredients(recipe, ingredients):
+    def __create_ingredients(recipe, amounts):
         '''creating a temporary table for recipes'''
         IngredientInRecipe.objects.bulk_create(
             [IngredientInRecipe(recipe=recipe,
-             ingredient_id=ingredient.get('id'),
-             amount=ingredient.get('amount'))
-             for ingredient in ingredients])
-
+             ingredient_id=ingredient_id,
+             amount=amount)
+             for ingredient_id, amount in amounts.items()])
+
+    @classmethod
+    def __update_ingredients(cls, recipe, amounts):
+        '''delete removed, update changed and insert new ingredients'''
+        current = {
+            ingredient_id: (pk, amount)
+            for pk, ingredient_id, amount in IngredientInRecipe.objects.filter(
+                recipe=recipe).values_list('id', 'ingredient_id', 'amount')
+        }
+        removed = [pk for ingredient_id, (pk, _) in current.items()
+                   if ingredient_id not in amounts]
+        if removed:
+            IngredientInRecipe.objects.filter(id__in=removed).delete()
+        changed = [
+            IngredientInRecipe(id=current[ingredient_id][0], amount=amount)
+            for ingredient_id, amount in amounts.items()
+            if ingredient_id in current
+            and current[ingredient_id][1] != amount
+        ]
+        if changed:
+            IngredientInRecipe.objects.bulk_update(changed, ['amount'])
+        cls.__create_ingredients(recipe, {
+            ingredient_id: amount for ingredient_id, amount in amounts.items()
+            if ingredient_id not in current
+        })
+
+    @transaction.atomic
     def create(self, validated_data):
         '''creating a recipe'''
         image = validated_data.pop('image')
@@ -207,79 +261,119 @@ class RecipeSerializer(serializers.ModelSerializer):
         recipe = RecipeList.objects.create(image=image, **validated_data)
         recipe.tags.set(tags)
         self.__create_ingredients(recipe, ingredients)
-        return recipe
+        recipe_matcher.schedule_update(recipe)
+        return RecipeList.objects.with_related().get(pk=recipe.pk)
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         '''update of recipe'''
-        instance.tags.clear()
-        instance.tags.set(validated_data.pop('tags'))
-        IngredientInRecipe.objects.filter(recipe=instance).delete()
-        self.__create_ingredients(
-            recipe=instance,
-            ingredients=validated_data.pop('ingredients')
-        )
+        tags = validated_data.pop('tags', None)
+        if tags is not None:
+            instance.tags.set(tags)
+        ingredients = validated_data.pop('ingredients', None)
+        if ingredients is not None:
+            self.__update_ingredients(instance, ingredients)
         super().update(instance, validated_data)
-        return instance
+        recipe_matcher.schedule_update(instance)
+        return RecipeList.objects.with_related().get(pk=instance.pk)
 
     def to_internal_value(self, data):
-        ingredients = data.pop('ingredients')
-        tags = data.pop('tags')
+        ingredients = data.pop('ingredients', None)
+        tags = data.pop('tags', None)
         data = super().to_internal_value(data)
-        data['tags'] = tags
-        data['ingredients'] = ingredients
+        if ingredients is not None or not self.partial:
+            data['ingredients'] = ingredients or []
+        if tags is not None or not self.partial:
+            data['tags'] = tags or []
         return data
 
+    def to_representation(self, instance):
+        '''the instance is loaded by `with_related`, create and update
+        reload the recipe they have written'''
+        return RecipeReadSerializer(instance, context=self.context).data
+
     def get_is_favorited(self, obj):
         '''check recipe in favorite list'''
-        user = self.context.get('request').user
-        if user.is_anonymous:
-            return False
-        return FavoriteRecipe.objects.filter(recipe=obj,
-                                             user=user).exists()
+        return get_viewer(self.context.get('request')).is_favorited(obj.id)
 
     def get_is_in_shopping_cart(self, obj):
         '''check the shopping cart'''
-        user = self.context.get('request').user
-        if not user or user.is_anonymous:
-            return False
-        return ShoppingCart.objects.filter(recipe=obj,
-                                           user=user).exists()
+        return get_viewer(
+            self.context.get('request')).is_in_shopping_cart(obj.id)
 
     def validate(self, data):
         '''validation of serializer-data'''
-        ingredients = data.get('ingredients')
         errors = []
+        if 'ingredients' in data:
+            data['ingredients'] = self.check_ingredients(
+                data['ingredients'], errors)
+        if 'tags' in data:
+            data['tags'] = self.check_tags(data['tags'], errors)
+        cooking_time = data.get('cooking_time')
+        if cooking_time is not None:
+            if cooking_time < constants.MIN_COOKING_TIME:
+                errors.append(
+                    f'The cooking time should be at least '
+                    f'{constants.MIN_COOKING_TIME} minute.'
+                )
+            if cooking_time > constants.MAX_COOKING_TIME:
+                errors.append(
+                    f'The cooking time should not be longer '
+                    f'{constants.MAX_COOKING_TIME} minute.'
+                )
+        if errors:
+            raise serializers.ValidationError({'errors': errors})
+        return data
+
+    @staticmethod
+    def check_ingredients(ingredients, errors):
+        '''{ingredient id: amount} of the existing ingredients'''
         if not ingredients:
             errors.append('Add at least one ingredient for the recipe')
-        added_ingredients = []
+            return {}
+        if not isinstance(ingredients, list) or not all(
+                isinstance(ingredient, dict) for ingredient in ingredients):
+            errors.append('Ingredients must be a list of objects '
+                          'with the id and amount')
+            return {}
+        amounts = {}
         for ingredient in ingredients:
-            if int(ingredient['amount']) < constants.MIN_INGREDIENT_AMOUNT:
+            try:
+                ingredient_id = int(ingredient['id'])
+                amount = int(ingredient['amount'])
+            except (KeyError, TypeError, ValueError):
+                errors.append('The ingredient must have a whole id and amount')
+                continue
+            if amount < constants.MIN_INGREDIENT_AMOUNT:
                 errors.append(
-                    f'The amount of the ingredient with id {ingredient["id"]} '
+                    f'The amount of the ingredient with id {ingredient_id} '
                     f'must be whole and not less than '
                     f'{constants.MIN_INGREDIENT_AMOUNT}.'
                 )
-            if ingredient['id'] in added_ingredients:
+            if ingredient_id in amounts:
                 errors.append(
                     'You cannot put the same ingredient in the recipe twice'
                 )
-            added_ingredients.append(ingredient['id'])
-        tags = data.get('tags')
-        if len(tags) > len(set(tags)):
+            amounts[ingredient_id] = amount
+        missing = amounts.keys() - set(Ingredient.objects.filter(
+            id__in=amounts).values_list('id', flat=True))
+        if missing:
+            errors.append(f'Ingredients with ids {sorted(missing)} '
+                          f'do not exist.')
+        return amounts
+
+    @staticmethod
+    def check_tags(tags, errors):
+        '''ids of the existing tags'''
+        try:
+            tag_ids = [int(tag) for tag in tags]
+        except (TypeError, ValueError):
+            errors.append('Tags must be given by their ids.')
+            return []
+        if len(tag_ids) > len(set(tag_ids)):
             errors.append('The same tag cannot be applied twice.')
-        cooking_time = float(data.get('cooking_time'))
-        if cooking_time < constants.MIN_COOKING_TIME:
-            errors.append(
-                f'The cooking time should be at least '
-                f'{constants.constants.MIN_COOKING_TIME} minute.'
-            )
-        if cooking_time > constants.MAX_COOKING_TIME:
-            errors.append(
-                f'The cooking time should not be longer '
-                f'{constants.MAX_COOKING_TIME} minute.'
-            )
-        if errors:
-            raise serializers.ValidationError({'errors': errors})
-        data['ingredients'] = ingredients
-        data['tags'] = tags
-        return data
+        missing = set(tag_ids) - set(Tag.objects.filter(
+            id__in=tag_ids).values_list('id', flat=True))
+        if missing:
+            errors.append(f'Tags with ids {sorted(missing)} do not exist.')
+        return list(dict.fromkeys(tag_ids))
@@ -1,48 +1,148 @@
-import base64
+import csv
+import json
 
-from django.core.files.base import ContentFile
-from django.http import HttpResponse
+from django.db import connections, router
+from django.db.models import Sum
+from django.http import StreamingHttpResponse
+from django.utils import timezone
 from rest_framework import serializers
 
+from api.images import decode_image, thumbnail_url
+from api.viewer import invalidate_viewer
 from core import constants
-from recipes.models import ShoppingCart
+from recipes.models import IngredientInRecipe
 
 
 class Base64ImageField(serializers.ImageField):
 
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+            data = decode_image(data)
         return super().to_internal_value(data)
 
+    def to_representation(self, value):
+        view = self.context.get('view')
+        if value and getattr(view, 'action', None) == 'list':
+            url = thumbnail_url(value, constants.LIST_THUMBNAIL_SIZE)
+            if url is not None:
+                request = self.context.get('request')
+                if request is not None:
+                    return request.build_absolute_uri(url)
+                return url
+        return super().to_representation(value)
 
-def collect_shopping_cart(request):
-    '''Creating a shopping cart'''
-    shopping_cart = ShoppingCart.objects.filter(user=request.user).all()
-    shopping_list = {}
-    for item in shopping_cart:
-        for recipe_ingredient in item.recipe.recipe_ingredients.all():
-            name = recipe_ingredient.ingredient.name
-            measuring_unit = recipe_ingredient.ingredient.measurement_unit
-            amount = recipe_ingredient.amount
-            if name not in shopping_list:
-                shopping_list[name] = {
-                    'name': name,
-                    'measurement_unit': measuring_unit,
-                    'amount': amount
-                }
-            else:
-                shopping_list[name]['amount'] += amount
-    content = (
-        [f'{item["name"]} ({item["measurement_unit"]}) '
-         f'- {item["amount"]}\n'
-         for item in shopping_list.values()]
+
+def add_relations(model, user, field, ids, returning=None):
+    '''INSERT ... ON CONFLICT DO NOTHING of (user, field) rows,
+    return `returning` values of the inserted rows'''
+    if not ids:
+        return []
+    returning = model._meta.get_field(returning or field).column
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    now = timezone.now()
+    extra = {f.column: now for f in model._meta.concrete_fields
+             if getattr(f, 'auto_now_add', False)}
+    columns = [model._meta.get_field('user').column,
+               model._meta.get_field(field).column, *extra]
+    row = f'({", ".join(["%s"] * len(columns))})'
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {quote(model._meta.db_table)} '
+            f'({", ".join(map(quote, columns))}) '
+            f'VALUES {", ".join([row] * len(ids))} '
+            f'ON CONFLICT DO NOTHING RETURNING {quote(returning)}',
+            [value for id in ids
+             for value in (user.id, id, *extra.values())],
+        )
+        added = [row[0] for row in cursor.fetchall()]
+    if added:
+        invalidate_viewer(user.id)
+    return added
+
+
+def remove_relations(model, user, field, ids):
+    '''DELETE of (user, field) rows, return ids of the removed ones'''
+    if not ids:
+        return []
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    user_column = model._meta.get_field('user').column
+    column = model._meta.get_field(field).column
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {quote(model._meta.db_table)} '
+            f'WHERE {quote(user_column)} = %s '
+            f'AND {quote(column)} IN ({", ".join(["%s"] * len(ids))}) '
+            f'RETURNING {quote(column)}',
+            [user.id, *ids],
+        )
+        removed = [row[0] for row in cursor.fetchall()]
+    if removed:
+        invalidate_viewer(user.id)
+    return removed
+
+
+class Echo:
+    '''File-like object which returns the written value'''
+    def write(self, value):
+        return value
+
+
+def get_shopping_cart_ingredients(user):
+    '''Sum of ingredients in the shopping cart grouped by the database'''
+    return (
+        IngredientInRecipe.objects
+        .filter(recipe__shopping_cart__user=user)
+        .values('ingredient__name', 'ingredient__measurement_unit')
+        .annotate(amount=Sum('amount'))
+        .order_by('ingredient__name', 'ingredient__measurement_unit')
     )
-    filename = constants.OUTPUT_FILENAME
-    response = HttpResponse(content, content_type='text/plain')
-    response['Content-Disposition'] = (
-        f'attachment; filename={0}'.format(filename)
+
+
+def shopping_list_txt(ingredients):
+    for item in ingredients:
+        yield (f'{item["ingredient__name"]} '
+               f'({item["ingredient__measurement_unit"]}) '
+               f'- {item["amount"]}\n')
+
+
+def shopping_list_csv(ingredients):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'measurement_unit', 'amount'))
+    for item in ingredients:
+        yield writer.writerow((item['ingredient__name'],
+                               item['ingredient__measurement_unit'],
+                               item['amount']))
+
+
+def shopping_list_json(ingredients):
+    separator = '['
+    for item in ingredients:
+        yield separator + json.dumps({
+            'name': item['ingredient__name'],
+            'measurement_unit': item['ingredient__measurement_unit'],
+            'amount': item['amount'],
+        }, ensure_ascii=False)
+        separator = ','
+    yield '[]' if separator == '[' else ']'
+
+
+SHOPPING_LIST_WRITERS = {
+    'txt': shopping_list_txt,
+    'csv': shopping_list_csv,
+    'json': shopping_list_json,
+}
+
+
+def collect_shopping_cart(request,
+                          file_format=constants.DEFAULT_SHOPPING_LIST_FORMAT):
+    '''Creating a shopping cart'''
+    ingredients = get_shopping_cart_ingredients(request.user).iterator()
+    response = StreamingHttpResponse(
+        SHOPPING_LIST_WRITERS[file_format](ingredients),
+        content_type=constants.SHOPPING_LIST_FORMATS[file_format],
     )
+    filename = f'{constants.OUTPUT_FILENAME}.{file_format}'
+    response['Content-Disposition'] = f'attachment; filename={filename}'
     return response
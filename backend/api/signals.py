@@ -0,0 +1,92 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from api.authentication import invalidate_tokens
+from api.cache import bump_version, set_modified
+from api.metrics import instrument
+from api.viewer import invalidate_viewer
+from recipes.counters import counters_changed
+from recipes.models import (
+    FavoriteRecipe,
+    Ingredient,
+    IngredientInRecipe,
+    RecipeList,
+    ShoppingCart,
+    Tag,
+)
+from users.models import Subscribe
+
+User = get_user_model()
+
+
+def invalidate_recipes():
+    '''Drop the cached recipe responses once the change is committed'''
+    transaction.on_commit(lambda: bump_version('recipes'))
+
+
+def touch_recipes():
+    '''Time a change of the fields refreshed over the cached recipes'''
+    transaction.on_commit(lambda: set_modified('recipe-fresh'))
+
+
+@receiver((post_save, post_delete), sender=RecipeList)
+@receiver((post_save, post_delete), sender=IngredientInRecipe)
+def invalidate_recipe(**kwargs):
+    invalidate_recipes()
+
+
+@receiver(m2m_changed, sender=RecipeList.tags.through)
+def invalidate_recipe_tags(action, **kwargs):
+    if action.startswith('post_'):
+        invalidate_recipes()
+
+
+@receiver(counters_changed)
+def touch_counters(**kwargs):
+    touch_recipes()
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_tags(**kwargs):
+    transaction.on_commit(lambda: bump_version('tags'))
+    invalidate_recipes()
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredients(**kwargs):
+    transaction.on_commit(lambda: bump_version('ingredients'))
+    invalidate_recipes()
+
+
+@receiver(post_delete, sender=RecipeList)
+def invalidate_recipe_ingredients(**kwargs):
+    transaction.on_commit(lambda: bump_version('recipe-ingredients'))
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_token(instance, **kwargs):
+    invalidate_tokens(instance.user_id)
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_tokens(instance, update_fields=None, **kwargs):
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    invalidate_tokens(instance.id)
+    touch_recipes()
+
+
+@receiver((post_save, post_delete), sender=FavoriteRecipe)
+@receiver((post_save, post_delete), sender=ShoppingCart)
+@receiver((post_save, post_delete), sender=Subscribe)
+def invalidate_viewer_context(instance, **kwargs):
+    invalidate_viewer(instance.user_id)
+
+
+@receiver(connection_created)
+def instrument_connection(connection, **kwargs):
+    instrument(connection)
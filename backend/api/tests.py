@@ -1,2 +1,1084 @@
+import base64
+import io
+import shutil
+import tempfile
+import threading
+import time
+from functools import partial
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.test import (
+    AsyncClient,
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from psycopg2 import extensions
+from rest_framework import serializers
+from rest_framework.authtoken.models import Token
+from rest_framework.test import (
+    APIClient,
+    APIRequestFactory,
+    force_authenticate,
+)
+
+from api import images
+from api.authentication import CachingTokenAuthentication
+from api.cache import bump_version, check_shared_cache, get_version
+from api.matching import RecipeMatcher
+from api.renderers import FastJSONRenderer
+from api.representations import RecipeReadSerializer, SubscribeReadSerializer
+from api.search import IngredientIndex
+from api.serializers import RecipeSerializer, SubscribeSerializer
+from api.services import get_shopping_cart_ingredients
+from api.views import IngredientsViewSet, RecipesViewSet, UserViewSet
+from core import constants
+from core.db.postgresql.base import ConnectionPool, Database, get_pool
+from recipes import feed
+from recipes.models import (
+    FavoriteRecipe,
+    FeedEntry,
+    Ingredient,
+    IngredientInRecipe,
+    RecipeList,
+    ShoppingCart,
+    Tag,
+)
+from recipes.search import set_similarity_threshold
+from users.models import Subscribe
+
+
+User = get_user_model()
+
+AUTHORS = 55
+RECIPES_PER_AUTHOR = 2
+
+
+def create_recipe_data():
+    '''a viewer subscribed to every author of two recipes each,
+    with some recipes in the favorites and in the shopping cart'''
+    viewer = User.objects.create_user(
+        username='viewer', email='viewer@example.com',
+        first_name='View', last_name='Er', password='viewer-password')
+    User.objects.bulk_create(
+        User(username=f'author{number}', email=f'author{number}@example.com',
+             first_name='Au', last_name=str(number))
+        for number in range(AUTHORS))
+    authors = list(User.objects.filter(username__startswith='author'))
+    Tag.objects.bulk_create(
+        Tag(name=f'tag{number}', color=f'#00000{number}', slug=f'tag{number}')
+        for number in range(3))
+    tags = list(Tag.objects.order_by('id'))
+    Ingredient.objects.bulk_create(
+        Ingredient(name=f'ingredient{number}', measurement_unit='g')
+        for number in range(10))
+    ingredients = list(Ingredient.objects.order_by('id'))
+    RecipeList.objects.bulk_create(
+        RecipeList(author=author, name=f'Recipe {author.last_name}.{number}',
+                   text='text', cooking_time=10 + number)
+        for author in authors for number in range(RECIPES_PER_AUTHOR))
+    recipes = list(RecipeList.objects.order_by('id'))
+    RecipeList.tags.through.objects.bulk_create(
+        RecipeList.tags.through(recipelist=recipe, tag=tags[index % 3])
+        for index, recipe in enumerate(recipes))
+    IngredientInRecipe.objects.bulk_create(
+        IngredientInRecipe(recipe=recipe,
+                           ingredient=ingredients[(index + shift) % 10],
+                           amount=shift + 1)
+        for index, recipe in enumerate(recipes) for shift in range(3))
+    Subscribe.objects.bulk_create(
+        Subscribe(user=viewer, author=author) for author in authors)
+    FavoriteRecipe.objects.bulk_create(
+        FavoriteRecipe(user=viewer, recipe=recipe) for recipe in recipes[::3])
+    ShoppingCart.objects.bulk_create(
+        ShoppingCart(user=viewer, recipe=recipe) for recipe in recipes[::4])
+    return viewer, recipes
+
+
+class SharedCacheTest(TestCase):
+    '''several workers refuse to keep the versions in process memory'''
+
+    def test_process_cache_of_several_workers(self):
+        for backend in ('django.core.cache.backends.locmem.LocMemCache',
+                        'django.core.cache.backends.dummy.DummyCache'):
+            with self.subTest(backend=backend), override_settings(
+                    WEB_CONCURRENCY=2, CACHES={'default': {
+                        'BACKEND': backend}}):
+                with self.assertRaises(ImproperlyConfigured):
+                    check_shared_cache()
+
+    def test_shared_cache(self):
+        with override_settings(WEB_CONCURRENCY=2, CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.memcached.'
+                           'PyMemcacheCache',
+                'LOCATION': 'memcached:11211'}}):
+            check_shared_cache()
+        with override_settings(WEB_CONCURRENCY=1):
+            check_shared_cache()
+
+
+class ApiTestCase(TestCase):
+    '''anonymous and authenticated clients over the recipe data'''
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer, cls.recipes = create_recipe_data()
+        cls.token = Token.objects.create(user=cls.viewer)
+
+    def setUp(self):
+        cache.clear()
+        self.anonymous = APIClient()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def get(self, client, url, queries):
+        '''response of a cold request which runs `queries` queries'''
+        cache.clear()
+        with self.assertNumQueries(queries):
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response
+
+
+class QueryCountTest(ApiTestCase):
+    '''the number of queries does not depend on the page size'''
+
+    def test_recipes_list(self):
+        for limit in (6, 50):
+            with self.subTest(limit=limit):
+                response = self.get(
+                    self.anonymous, f'/api/recipes/?limit={limit}', 5)
+                self.assertEqual(len(response.data['results']), limit)
+                response = self.get(
+                    self.client, f'/api/recipes/?limit={limit}', 9)
+                self.assertEqual(len(response.data['results']), limit)
+
+    def test_recipes_pages(self):
+        for url in ('/api/recipes/', '/api/recipes/?page=2'):
+            with self.subTest(url=url):
+                self.get(self.anonymous, url, 5)
+                self.get(self.client, url, 9)
+
+    def test_recipes_cursor_pages(self):
+        '''no COUNT query'''
+        response = self.get(
+            self.anonymous, '/api/recipes/?pagination=cursor', 4)
+        self.get(self.client, '/api/recipes/?pagination=cursor', 8)
+        url = response.data['next']
+        self.get(self.anonymous, url, 4)
+        self.get(self.client, url, 8)
+
+    def test_recipe_detail(self):
+        url = f'/api/recipes/{self.recipes[0].id}/'
+        self.get(self.anonymous, url, 4)
+        self.get(self.client, url, 8)
+
+    def test_bench_renderers(self):
+        for page_size in (6, 50):
+            with self.subTest(page_size=page_size), \
+                    self.assertNumQueries(3):
+                call_command('bench_renderers', page_size=page_size,
+                             number=1, stdout=io.StringIO())
+
+    def test_subscriptions(self):
+        for limit in (6, 50):
+            with self.subTest(limit=limit):
+                response = self.get(
+                    self.client,
+                    f'/api/users/subscriptions/?limit={limit}'
+                    f'&recipes_limit=1', 4)
+                self.assertEqual(len(response.data['results']), limit)
+                self.assertTrue(all(
+                    len(author['recipes']) == 1
+                    for author in response.data['results']))
+
+
+class CursorSearchTest(ApiTestCase):
+    '''the rank order of the search is not replaced by the cursor order'''
+
+    def test_cursor_search_is_rejected(self):
+        for params in ('pagination=cursor', 'cursor=cD0yMDI2'):
+            with self.subTest(params=params):
+                response = self.anonymous.get(
+                    f'/api/recipes/?search=recipe&{params}')
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('pagination', response.data)
+
+
+class ResponseCacheTest(ApiTestCase):
+    '''counters and authors are refreshed over the cached recipes
+    without dropping them'''
+
+    def setUp(self):
+        super().setUp()
+        self.recipe = RecipeList.objects.order_by('-pub_date', '-id')[0]
+        self.url = f'/api/recipes/{self.recipe.id}/'
+        self.other_client = APIClient()
+        self.other_client.force_authenticate(self.recipes[1].author)
+
+    def cached_get(self, client, url):
+        '''response served from the cache by one refreshing query'''
+        with self.assertNumQueries(1):
+            return client.get(url)
+
+    def test_favorite_refreshes_the_counter(self):
+        for url in ('/api/recipes/', self.url):
+            with self.subTest(url=url):
+                self.other_client.delete(
+                    f'/api/recipes/{self.recipe.id}/favorite/')
+                self.recipe.refresh_from_db()
+                cache.clear()
+                etag = self.client.get(url)['ETag']
+                version = get_version('recipes')
+                with self.captureOnCommitCallbacks(execute=True):
+                    response = self.other_client.post(
+                        f'/api/recipes/{self.recipe.id}/favorite/')
+                self.assertEqual(response.status_code, 201)
+                self.assertEqual(get_version('recipes'), version)
+                response = self.cached_get(self.client, url)
+                recipes = response.data.get('results', [response.data])
+                recipe = next(recipe for recipe in recipes
+                              if recipe['id'] == self.recipe.id)
+                self.assertEqual(recipe['favorites_count'],
+                                 self.recipe.favorites_count + 1)
+                self.assertNotEqual(response['ETag'], etag)
+
+    def test_author_change_refreshes_the_author(self):
+        self.anonymous.get(self.url)
+        version = get_version('recipes')
+        author = self.recipe.author
+        author.username = 'renamed'
+        with self.captureOnCommitCallbacks(execute=True):
+            author.save()
+        self.assertEqual(get_version('recipes'), version)
+        response = self.cached_get(self.anonymous, self.url)
+        self.assertEqual(response.data['author']['username'], 'renamed')
+
+    def test_not_modified(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_modified_by_the_viewer(self):
+        # a drifted counter is not changed, only the viewer version is
+        ShoppingCart.objects.bulk_create(
+            [ShoppingCart(user=self.viewer, recipe=self.recipe)],
+            ignore_conflicts=True)
+        RecipeList.objects.filter(id=self.recipe.id).update(
+            shopping_cart_count=0)
+        response = self.client.get(self.url)
+        self.assertTrue(response.data['is_in_shopping_cart'])
+        last_modified = response['Last-Modified']
+        with mock.patch('time.time', return_value=time.time() + 60), \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(
+                f'/api/recipes/{self.recipe.id}/shopping_cart/')
+        self.assertEqual(response.status_code, 204)
+        response = self.client.get(
+            self.url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.data['is_in_shopping_cart'])
+        self.assertNotEqual(response['Last-Modified'], last_modified)
+
+    @override_settings(ALLOWED_HOSTS=['a.example', 'b.example'])
+    def test_host_in_the_key(self):
+        RecipeList.objects.filter(id=self.recipe.id).update(
+            image='recipes/images/recipe.png')
+        for host in ('a.example', 'b.example'):
+            with self.subTest(host=host):
+                response = self.anonymous.get(self.url, HTTP_HOST=host)
+                self.assertTrue(response.data['image'].startswith(
+                    f'http://{host}/'), response.data['image'])
+
+
+class RecipesLimitTest(ApiTestCase):
+    '''`recipes_limit` must be a whole number of at least zero'''
+
+    def test_invalid_recipes_limit(self):
+        author = self.recipes[0].author
+        Subscribe.objects.filter(user=self.viewer, author=author).delete()
+        for value in ('abc', '-1', '1.5'):
+            with self.subTest(recipes_limit=value):
+                response = self.client.get(
+                    f'/api/users/subscriptions/?recipes_limit={value}')
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('recipes_limit', response.data)
+                response = self.client.post(
+                    f'/api/users/{author.id}/subscribe/'
+                    f'?recipes_limit={value}')
+                self.assertEqual(response.status_code, 400)
+                self.assertFalse(Subscribe.objects.filter(
+                    user=self.viewer, author=author).exists())
+
+    def test_recipes_limit(self):
+        response = self.client.get(
+            '/api/users/subscriptions/?recipes_limit=0')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(all(not author['recipes']
+                            for author in response.data['results']))
+        author = self.recipes[0].author
+        Subscribe.objects.filter(user=self.viewer, author=author).delete()
+        response = self.client.post(
+            f'/api/users/{author.id}/subscribe/?recipes_limit=1')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data['recipes']), 1)
+
+
+class PasswordChangeTest(ApiTestCase):
+    '''the cached token lookup does not outlive a password change'''
+
+    def test_token_is_rejected_after_password_change(self):
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/users/set_password/', {
+                'current_password': 'viewer-password',
+                'new_password': 'new-viewer-password',
+            })
+        self.assertEqual(response.status_code, 204, response.content)
+        self.assertFalse(Token.objects.filter(user=self.viewer).exists())
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 401)
+
+
+class TokenCacheTest(ApiTestCase):
+    '''cached token lookups are invalidated per user
+    and build a fresh user for every request'''
+
+    def setUp(self):
+        super().setUp()
+        CachingTokenAuthentication._local.clear()
+        self.authentication = CachingTokenAuthentication()
+        self.authentication.authenticate_credentials(self.token.key)
+
+    def authenticate(self, queries):
+        with self.assertNumQueries(queries):
+            return self.authentication.authenticate_credentials(
+                self.token.key)
+
+    def test_fresh_instances(self):
+        user, token = self.authenticate(0)
+        other_user, other_token = self.authenticate(0)
+        self.assertEqual(user, self.viewer)
+        self.assertEqual(token.key, self.token.key)
+        self.assertIs(token.user, user)
+        self.assertIsNot(user, other_user)
+        self.assertIsNot(token, other_token)
+        self.assertFalse(user._state.adding)
+
+    def test_other_users_keep_the_cache(self):
+        author = self.recipes[0].author
+        with self.captureOnCommitCallbacks(execute=True):
+            author.first_name = 'Renamed'
+            author.save()
+        self.authenticate(0)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.viewer.first_name = 'Renamed'
+            self.viewer.save()
+        user, token = self.authenticate(1)
+        self.assertEqual(user.first_name, 'Renamed')
+
+    def test_last_login_keeps_the_cache(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.viewer.save(update_fields=['last_login'])
+        self.authenticate(0)
+
+
+@override_settings(METRICS_SAMPLE_RATE=1)
+class MetricsTest(ApiTestCase):
+    '''Server-Timing of the sampled requests'''
+
+    def assertTimed(self, response, queries):
+        self.assertEqual(response.status_code, 200)
+        timing = response['Server-Timing']
+        self.assertIn(f'desc="{queries} queries"', timing)
+        self.assertIn('serialize;dur=', timing)
+
+    def test_wsgi(self):
+        self.assertTimed(self.anonymous.get('/api/recipes/'), 5)
+
+    async def test_sync_view_under_asgi(self):
+        response = await AsyncClient().get(
+            '/api/users/subscriptions/?recipes_limit=1',
+            authorization=f'Token {self.token.key}')
+        self.assertTimed(response, 4)
+
+
+class IngredientSearchTest(TestCase):
+    '''autocomplete of the ingredient names from the in-memory index'''
+
+    @classmethod
+    def setUpTestData(cls):
+        Ingredient.objects.bulk_create(
+            Ingredient(name=name, measurement_unit='g')
+            for name in ('Sea salt', 'salt', 'Salted butter', 'sugar',
+                         'Basalt pepper', 'butter'))
+
+    def setUp(self):
+        cache.clear()
+
+    def names(self, query):
+        response = self.client.get('/api/ingredients/', {'name': query})
+        self.assertEqual(response.status_code, 200)
+        return [item['name'] for item in response.json()]
+
+    def test_prefix_before_substring(self):
+        self.assertEqual(self.names('salt'), [
+            'salt', 'Salted butter', 'Basalt pepper', 'Sea salt'])
+
+    def test_same_set_as_icontains(self):
+        for query in ('salt', 'SAL', 'butter', 't', 'er', 'ea s', 'none'):
+            with self.subTest(query=query):
+                self.assertEqual(
+                    sorted(self.names(query)),
+                    sorted(Ingredient.objects.filter(
+                        name__icontains=query).values_list(
+                        'name', flat=True)))
+
+    def test_reload_after_version_bump(self):
+        index = IngredientIndex()
+        self.assertEqual(index.search('pep'), [
+            {'id': Ingredient.objects.get(name='Basalt pepper').id,
+             'name': 'Basalt pepper', 'measurement_unit': 'g'}])
+        pepper = Ingredient.objects.create(name='pepper', measurement_unit='g')
+        with self.assertNumQueries(0):
+            self.assertEqual(len(index.search('pep')), 1)
+        bump_version('ingredients')
+        with self.assertNumQueries(1):
+            self.assertEqual(index.search('pep')[0]['id'], pepper.id)
+
+
+def image_data_url(width, height, image_format='PNG'):
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height)).save(buffer, image_format)
+    encoded = base64.b64encode(buffer.getvalue()).decode()
+    return f'data:image/{image_format.lower()};base64,{encoded}'
+
+
+class ImageUploadTest(ApiTestCase):
+    '''base64 images are checked before they are decoded in full'''
+
+    def setUp(self):
+        super().setUp()
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+
+    def post_recipe(self, image):
+        with override_settings(MEDIA_ROOT=self.media):
+            return self.client.post('/api/recipes/', {
+                'tags': [Tag.objects.first().id],
+                'ingredients': [{'id': Ingredient.objects.first().id,
+                                 'amount': 10}],
+                'name': 'Uploaded', 'text': 'text', 'cooking_time': 5,
+                'image': image,
+            }, format='json')
+
+    def test_valid(self):
+        response = self.post_recipe(image_data_url(40, 30))
+        self.assertEqual(response.status_code, 201, response.data)
+        image = RecipeList.objects.get(name='Uploaded').image
+        self.assertTrue(image.name.endswith('.png'))
+        with override_settings(MEDIA_ROOT=self.media):
+            with image.open() as file, Image.open(file) as decoded:
+                self.assertEqual(decoded.size, (40, 30))
+
+    def test_malformed(self):
+        for image in ('data:image/png,abc', 'data:image/png;base64,!!!!',
+                      'data:image/png;base64,abc', 'data:image;base64,'):
+            with self.subTest(image=image):
+                response = self.post_recipe(image)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('image', response.data)
+
+    def test_oversized(self):
+        response = self.post_recipe(
+            image_data_url(constants.MAX_IMAGE_DIMENSION + 1, 1))
+        self.assertEqual(response.status_code, 400)
+        with mock.patch.object(constants, 'MAX_IMAGE_SIZE', 100):
+            response = self.post_recipe(image_data_url(300, 300, 'BMP'))
+        self.assertEqual(response.status_code, 400)
+
+    @mock.patch.object(constants, 'IMAGE_DECODE_CHUNK', 8)
+    def test_header_split_between_chunks(self):
+        data = image_data_url(constants.MAX_IMAGE_DIMENSION + 1, 1)
+        with mock.patch.object(images, 'check_dimensions',
+                               wraps=images.check_dimensions) as check:
+            with self.assertRaises(serializers.ValidationError):
+                images.decode_image(data)
+        for call in check.call_args_list:
+            self.assertTrue(call.args[0].getvalue().startswith(b'\x89PNG'))
+
+
+class RecipeWriteTest(ApiTestCase):
+    '''ingredients of the created and updated recipes'''
+
+    def setUp(self):
+        super().setUp()
+        self.ingredients = list(Ingredient.objects.order_by('id')[:4])
+        self.recipe = RecipeList.objects.create(
+            author=self.viewer, name='Own', text='text', cooking_time=5)
+        self.recipe.tags.set([Tag.objects.first()])
+        IngredientInRecipe.objects.bulk_create(
+            IngredientInRecipe(recipe=self.recipe, ingredient=ingredient,
+                               amount=amount)
+            for ingredient, amount in zip(self.ingredients, (10, 20, 30)))
+        self.url = f'/api/recipes/{self.recipe.id}/'
+
+    def rows(self):
+        return {ingredient_id: (pk, amount)
+                for pk, ingredient_id, amount in self.recipe.recipe_ingredients
+                .values_list('id', 'ingredient_id', 'amount')}
+
+    def test_malformed_ingredients(self):
+        rows = self.rows()
+        for ingredients in (5, 'abc', [5], {'id': 1, 'amount': 1},
+                            [{'id': 1, 'amount': 1}, 'abc'], []):
+            with self.subTest(ingredients=ingredients):
+                response = self.client.post('/api/recipes/', {
+                    'tags': [Tag.objects.first().id],
+                    'ingredients': ingredients,
+                    'name': 'Malformed', 'text': 'text', 'cooking_time': 5,
+                    'image': image_data_url(1, 1),
+                }, format='json')
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('errors', response.data)
+                response = self.client.patch(
+                    self.url, {'ingredients': ingredients}, format='json')
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('errors', response.data)
+        self.assertFalse(RecipeList.objects.filter(name='Malformed').exists())
+        self.assertEqual(self.rows(), rows)
+
+    def test_update_ingredients(self):
+        rows = self.rows()
+        kept, changed, removed, added = self.ingredients
+        response = self.client.patch(self.url, {'ingredients': [
+            {'id': kept.id, 'amount': 10},
+            {'id': changed.id, 'amount': 25},
+            {'id': added.id, 'amount': 5},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        updated = self.rows()
+        self.assertEqual(updated[kept.id], rows[kept.id])
+        self.assertEqual(updated[changed.id], (rows[changed.id][0], 25))
+        self.assertNotIn(removed.id, updated)
+        self.assertEqual(updated[added.id][1], 5)
+        self.assertEqual(
+            {(item['id'], item['amount'])
+             for item in response.data['ingredients']},
+            {(kept.id, 10), (changed.id, 25), (added.id, 5)})
+
+
+class RecipeMatcherTest(ApiTestCase):
+    '''the index follows the recipe changes without full rebuilds'''
+
+    def setUp(self):
+        super().setUp()
+        self.matcher = RecipeMatcher()
+        self.recipe = self.recipes[0]
+        self.ingredient = Ingredient.objects.create(
+            name='rare', measurement_unit='g')
+        IngredientInRecipe.objects.create(
+            recipe=self.recipe, ingredient=self.ingredient, amount=1)
+
+    def test_update_of_current_index(self):
+        self.matcher.load()
+        with self.assertNumQueries(2):
+            self.matcher.update_recipe(self.recipe)
+        with self.assertNumQueries(0):
+            matches = self.matcher.match([self.ingredient.id])
+        self.assertEqual(matches, [(self.recipe.id, 1, 3)])
+
+    def test_update_without_index(self):
+        version = get_version('recipe-ingredients')
+        with self.assertNumQueries(0):
+            self.matcher.update_recipe(self.recipe)
+        self.assertEqual(get_version('recipe-ingredients'), version + 1)
+
+    def test_stale_index_is_rebuilt_by_match(self):
+        self.matcher.load()
+        bump_version('recipe-ingredients')
+        with self.assertNumQueries(0):
+            self.matcher.update_recipe(self.recipe)
+        with self.assertNumQueries(3):
+            matches = self.matcher.match([self.ingredient.id])
+        self.assertEqual(matches, [(self.recipe.id, 1, 3)])
+
+    def test_update_leaves_the_old_snapshot_intact(self):
+        index = self.matcher.load()
+        IngredientInRecipe.objects.filter(ingredient=self.ingredient).delete()
+        self.matcher.update_recipe(self.recipe)
+        self.assertEqual(list(index.postings[self.ingredient.id]),
+                         [self.recipe.id])
+        self.assertEqual(self.matcher.match([self.ingredient.id]), [])
+
+
+class MatchViewTest(ApiTestCase):
+    '''/recipes/match/ pages and filters the matched recipes'''
+
+    def setUp(self):
+        super().setUp()
+        self.ingredient = Ingredient.objects.order_by('id')[0]
+        self.matching = set(IngredientInRecipe.objects.filter(
+            ingredient=self.ingredient).values_list('recipe_id', flat=True))
+
+    def match(self, **params):
+        response = self.anonymous.get(
+            '/api/recipes/match/',
+            {'ingredients': self.ingredient.id, 'limit': 100, **params})
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def ids(self, **params):
+        return {recipe['id'] for recipe in self.match(**params)['results']}
+
+    def test_pages(self):
+        data = self.match(limit=4)
+        self.assertEqual(data['count'], len(self.matching))
+        self.assertEqual(len(data['results']), 4)
+        self.assertEqual(
+            [(recipe['matched_count'], recipe['missing_count'])
+             for recipe in data['results']], [(1, 2)] * 4)
+        second = self.match(limit=4, page=2)['results']
+        self.assertTrue({recipe['id'] for recipe in data['results']}
+                        .isdisjoint(recipe['id'] for recipe in second))
+        self.assertEqual(self.ids(), self.matching)
+
+    def test_filters(self):
+        self.assertEqual(self.ids(tags='tag1'), self.matching & set(
+            RecipeList.objects.filter(tags__slug='tag1').values_list(
+                'id', flat=True)))
+        self.assertEqual(self.ids(max_cooking_time=10), self.matching & set(
+            RecipeList.objects.filter(cooking_time__lte=10).values_list(
+                'id', flat=True)))
+
+    def test_bad_params(self):
+        for params in ({'ingredients': 'abc'}, {'max_cooking_time': 'x'}):
+            with self.subTest(params=params):
+                response = self.anonymous.get('/api/recipes/match/', params)
+                self.assertEqual(response.status_code, 400)
+
+
+@mock.patch.object(constants, 'FEED_MAX_LENGTH', 3)
+class FeedTest(ApiTestCase):
+    '''feeds are cut on writes, reading them does not write'''
+
+    def setUp(self):
+        super().setUp()
+        self.authors = User.objects.filter(username__in=['author0', 'author1'])
+
+    def test_backfill_trims_the_feed(self):
+        for author in self.authors:
+            feed.backfill(self.viewer, author)
+        self.assertEqual(FeedEntry.objects.filter(user=self.viewer).count(), 3)
+
+    def feed_recipes(self, user):
+        return set(FeedEntry.objects.filter(user=user).values_list(
+            'recipe_id', flat=True))
+
+    def test_trim_all(self):
+        FeedEntry.objects.bulk_create(
+            FeedEntry(user=user, recipe=recipe, pub_date=recipe.pub_date)
+            for user in (self.viewer, self.recipes[0].author)
+            for recipe in self.recipes[:5])
+        self.assertEqual(feed.trim_all(), 4)
+        self.assertEqual(FeedEntry.objects.filter(user=self.viewer).count(), 3)
+
+    def test_trim_cuts_ties_by_recipe(self):
+        pub_date = self.recipes[0].pub_date
+        newest = {recipe.id for recipe in self.recipes[2:5]}
+        for trim in (lambda: feed.trim(self.viewer),
+                     lambda: feed.trim_all([self.viewer.id])):
+            with self.subTest(trim=trim):
+                FeedEntry.objects.all().delete()
+                FeedEntry.objects.bulk_create(
+                    FeedEntry(user=self.viewer, recipe=recipe,
+                              pub_date=pub_date)
+                    for recipe in self.recipes[:5])
+                trim()
+                self.assertEqual(self.feed_recipes(self.viewer), newest)
+
+    def test_fan_out_trims_the_feeds(self):
+        for author in self.authors:
+            feed.backfill(self.viewer, author)
+        recipe = RecipeList.objects.create(
+            author=self.recipes[-1].author, name='New', text='text',
+            cooking_time=5)
+        recipe.author.subscribers_count = constants.FEED_FANOUT_LIMIT + 1
+        feed.fan_out(recipe)
+        self.assertEqual(FeedEntry.objects.filter(user=self.viewer).count(), 3)
+        self.assertIn(recipe.id, self.feed_recipes(self.viewer))
+
+    @mock.patch.object(constants, 'FEED_FANOUT_LIMIT', 1)
+    def test_author_stops_being_pulled(self):
+        author = self.recipes[-1].author
+        other = User.objects.get(username='author0')
+        Subscribe.objects.create(user=other, author=author)
+        User.objects.filter(pk=author.pk).update(subscribers_count=2)
+        client = APIClient()
+        client.force_authenticate(other)
+        response = client.delete(f'/api/users/{author.id}/subscribe/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(
+            self.feed_recipes(self.viewer),
+            set(RecipeList.objects.filter(author=author).values_list(
+                'id', flat=True)))
+
+    def test_reading_the_feed_does_not_write(self):
+        for author in self.authors:
+            feed.backfill(self.viewer, author)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/users/feed/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 3)
+        self.assertFalse(any(query['sql'].startswith('DELETE')
+                             for query in queries))
+
+
+class ConcurrentRequestsTest(TransactionTestCase):
+    '''simultaneous duplicates add a single row and fail with 400'''
+    requests = 8
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('writers of in-memory SQLite fail, not wait')
+        self.viewer = User.objects.create_user(
+            username='viewer', email='viewer@example.com', password='viewer')
+        self.author = User.objects.create_user(
+            username='author', email='author@example.com', password='author')
+        self.recipe = RecipeList.objects.create(
+            author=self.author, name='Recipe', text='text', cooking_time=10)
+        self.token = Token.objects.create(user=self.viewer)
+
+    def post_at_once(self, url):
+        '''statuses of the same POST sent by parallel clients'''
+        barrier = threading.Barrier(self.requests)
+        statuses = []
+
+        def post():
+            client = APIClient(raise_request_exception=False)
+            client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+            try:
+                barrier.wait()
+                statuses.append(client.post(url).status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=post)
+                   for _ in range(self.requests)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return sorted(statuses)
+
+    def assertAddedOnce(self, url, queryset):
+        statuses = self.post_at_once(url)
+        self.assertEqual(
+            statuses, [201] + [400] * (self.requests - 1), statuses)
+        self.assertEqual(queryset.count(), 1)
+
+    def test_favorite(self):
+        self.assertAddedOnce(
+            f'/api/recipes/{self.recipe.id}/favorite/',
+            FavoriteRecipe.objects.filter(user=self.viewer))
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 1)
+
+    def test_shopping_cart(self):
+        self.assertAddedOnce(
+            f'/api/recipes/{self.recipe.id}/shopping_cart/',
+            ShoppingCart.objects.filter(user=self.viewer))
+
+    def test_subscribe(self):
+        self.assertAddedOnce(
+            f'/api/users/{self.author.id}/subscribe/',
+            Subscribe.objects.filter(user=self.viewer))
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.subscribers_count, 1)
+
+
+def get_view(viewset, action, url, user=None):
+    '''viewset instance set up to handle the GET request by the action'''
+    request = APIRequestFactory().get(url)
+    if user is not None:
+        force_authenticate(request, user)
+    view = viewset(action_map={'get': action}, format_kwarg=None, kwargs={})
+    view.request = view.initialize_request(request)
+    return view
+
+
+def view_queryset(viewset, action, url, user=None):
+    '''filtered queryset of the first page the action builds'''
+    view = get_view(viewset, action, url, user)
+    queryset = view.filter_queryset(view.get_queryset())
+    return queryset[:constants.DEFAULT_PAGE_SIZE]
+
+
+class RepresentationContractTest(ApiTestCase):
+    '''the read serializers render the bytes of the model serializers'''
+
+    def setUp(self):
+        super().setUp()
+        RecipeList.objects.filter(id=self.recipes[0].id).update(
+            image='recipes/images/recipe.png', favorites_count=3)
+        User.objects.filter(id=self.recipes[0].author_id).update(
+            recipes_count=2, subscribers_count=1)
+
+    def assertSameBytes(self, old, new):
+        render = FastJSONRenderer().render
+        self.assertEqual(render(old.data), render(new.data))
+
+    def test_recipes(self):
+        for action in ('list', 'retrieve'):
+            for user in (None, self.viewer):
+                with self.subTest(action=action, user=user):
+                    view = get_view(RecipesViewSet, action, '/api/recipes/',
+                                    user)
+                    context = {'request': view.request, 'view': view}
+                    for recipe in RecipeList.objects.with_related():
+                        old = RecipeSerializer(recipe, context=context)
+                        old.to_representation = partial(
+                            serializers.ModelSerializer.to_representation,
+                            old)
+                        self.assertSameBytes(old, RecipeReadSerializer(
+                            recipe, context=context))
+
+    def test_subscriptions(self):
+        view = get_view(UserViewSet, 'subscriptions',
+                        '/api/users/subscriptions/?recipes_limit=1',
+                        self.viewer)
+        context = {'request': view.request, 'view': view}
+        subscriptions = view.get_subscriptions_queryset()
+        self.assertSameBytes(
+            SubscribeSerializer(subscriptions, many=True, context=context),
+            SubscribeReadSerializer(subscriptions, many=True,
+                                    context=context))
+
+
+def foreign_key_index(model, field):
+    '''name of the index django creates for the foreign key'''
+    return connection.schema_editor()._create_index_name(
+        model._meta.db_table, [model._meta.get_field(field).column],
+        suffix='')
+
+
+@skipUnless(connection.vendor == 'postgresql', 'EXPLAIN of PostgreSQL')
+class IndexUsageTest(ApiTestCase):
+    '''the hot queries of the views use the indexes of the migrations'''
+
+    def explain(self, queryset):
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        return queryset.explain()
+
+    def assertUsesIndex(self, queryset, *names):
+        plan = self.explain(queryset)
+        self.assertTrue(any(name in plan for name in names),
+                        f'none of {names} is used:\n{plan}')
+
+    def test_recipes_page(self):
+        self.assertUsesIndex(
+            view_queryset(RecipesViewSet, 'list', '/api/recipes/'),
+            'recipe_pub_date_idx')
+
+    def test_recipes_of_author(self):
+        author = self.recipes[0].author_id
+        self.assertUsesIndex(
+            view_queryset(RecipesViewSet, 'list',
+                          f'/api/recipes/?author={author}'),
+            'recipe_author_pub_date_idx')
+
+    def test_recipes_by_tags(self):
+        through = RecipeList.tags.through
+        self.assertUsesIndex(
+            view_queryset(RecipesViewSet, 'list', '/api/recipes/?tags=tag0'),
+            foreign_key_index(through, 'tag'),
+            foreign_key_index(through, 'recipelist'))
+
+    def test_favorited_recipes(self):
+        self.assertUsesIndex(
+            view_queryset(RecipesViewSet, 'list',
+                          '/api/recipes/?is_favorited=1', self.viewer),
+            'unique_favorite_list_user')
+
+    def test_recipes_in_shopping_cart(self):
+        self.assertUsesIndex(
+            view_queryset(RecipesViewSet, 'list',
+                          '/api/recipes/?is_in_shopping_cart=1', self.viewer),
+            'unique_cart_list_user')
+
+    def test_subscriptions(self):
+        view = get_view(UserViewSet, 'subscriptions',
+                        '/api/users/subscriptions/', self.viewer)
+        self.assertUsesIndex(
+            view.get_subscriptions_queryset()[:constants.DEFAULT_PAGE_SIZE],
+            'unique_subscribing', foreign_key_index(Subscribe, 'user'))
+
+    def test_shopping_cart_ingredients(self):
+        self.assertUsesIndex(
+            get_shopping_cart_ingredients(self.viewer),
+            'unique_cart_list_user')
+
+    def test_ingredient_name_prefix(self):
+        view = get_view(IngredientsViewSet, 'list',
+                        '/api/ingredients/?name=ingr')
+        self.assertUsesIndex(
+            view.filter_queryset(view.get_queryset()),
+            'ingredient_upper_name_like_idx')
+
+    def test_search(self):
+        plan = self.explain(view_queryset(
+            RecipesViewSet, 'list', '/api/recipes/?search=recipe'))
+        self.assertIn('recipe_search_vector_idx', plan)
+        self.assertIn('recipe_name_trgm_idx', plan)
+
+
+class FakeConnection:
+    '''psycopg2 connection the pool looks at'''
+
+    def __init__(self, status=extensions.TRANSACTION_STATUS_IDLE,
+                 healthy=True):
+        self.status = status
+        self.healthy = healthy
+        self.closed = 0
+        self.rollbacks = 0
+
+    def get_transaction_status(self):
+        return self.status
+
+    def rollback(self):
+        if not self.healthy:
+            raise Database.OperationalError('server closed the connection')
+        self.rollbacks += 1
+        self.status = extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+    def cursor(self):
+        cursor = mock.MagicMock()
+        if not self.healthy:
+            cursor.__enter__.return_value.execute.side_effect = (
+                Database.OperationalError('server closed the connection'))
+        return cursor
+
+
+class ConnectionPoolTest(SimpleTestCase):
+    '''connections handed over between the threads of a worker'''
+
+    def setUp(self):
+        self.connect = mock.Mock(side_effect=FakeConnection)
+
+    def test_acquire_and_release(self):
+        pool = ConnectionPool('default', 2, 1)
+        first = pool.acquire(self.connect)
+        second = pool.acquire(self.connect)
+        self.assertIsNot(first, second)
+        self.assertEqual(pool.state(), (2, 2, 0, 0))
+        pool.release(first)
+        self.assertEqual(pool.state(), (2, 1, 1, 0))
+        self.assertIs(pool.acquire(self.connect), first)
+        self.assertEqual(self.connect.call_count, 2)
+        self.assertFalse(first.closed)
+
+    def test_release_rolls_back(self):
+        pool = ConnectionPool('default', 1, 1)
+        connection = pool.acquire(self.connect)
+        connection.status = extensions.TRANSACTION_STATUS_INERROR
+        pool.release(connection)
+        self.assertEqual(connection.rollbacks, 1)
+        self.assertIs(pool.acquire(self.connect), connection)
+
+    def test_release_discards(self):
+        pool = ConnectionPool('default', 1, 1)
+        for status, healthy in (
+                (extensions.TRANSACTION_STATUS_ACTIVE, True),
+                (extensions.TRANSACTION_STATUS_UNKNOWN, True),
+                (extensions.TRANSACTION_STATUS_INTRANS, False)):
+            with self.subTest(status=status, healthy=healthy):
+                connection = pool.acquire(self.connect)
+                connection.status = status
+                connection.healthy = healthy
+                pool.release(connection)
+                self.assertTrue(connection.closed)
+                self.assertEqual(pool.state(), (1, 0, 0, 0))
+
+    def test_expired(self):
+        pool = ConnectionPool('default', 1, 1, max_age=0)
+        connection = pool.acquire(self.connect)
+        pool.release(connection)
+        self.assertTrue(connection.closed)
+        self.assertIsNot(pool.acquire(self.connect), connection)
+
+    def test_health_checks(self):
+        pool = ConnectionPool('default', 1, 1, health_checks=True)
+        connection = pool.acquire(self.connect)
+        pool.release(connection)
+        self.assertIs(pool.acquire(self.connect), connection)
+        pool.release(connection)
+        connection.healthy = False
+        other = pool.acquire(self.connect)
+        self.assertIsNot(other, connection)
+        self.assertTrue(connection.closed)
+        self.assertEqual(pool.state(), (1, 1, 0, 0))
+
+    def test_timeout(self):
+        pool = ConnectionPool('default', 1, 0.01)
+        pool.acquire(self.connect)
+        with self.assertRaises(Database.OperationalError):
+            pool.acquire(self.connect)
+        self.assertEqual(pool.state(), (1, 1, 0, 0))
+
+    def test_failed_connect_frees_the_slot(self):
+        pool = ConnectionPool('default', 1, 0.01)
+        with self.assertRaises(Database.OperationalError):
+            pool.acquire(mock.Mock(side_effect=Database.OperationalError))
+        self.assertEqual(pool.state(), (1, 0, 0, 0))
+        pool.acquire(self.connect)
+
+    def test_waiting_thread_gets_the_released_connection(self):
+        pool = ConnectionPool('default', 1, 5)
+        connection = pool.acquire(self.connect)
+        acquired = []
+        thread = threading.Thread(
+            target=lambda: acquired.append(pool.acquire(self.connect)))
+        thread.start()
+        while pool.state()[3] == 0:
+            time.sleep(0.001)
+        pool.release(connection)
+        thread.join()
+        self.assertEqual(acquired, [connection])
+
+    def test_pool_of_the_connection_parameters(self):
+        settings_dict = {
+            'NAME': 'foodgram', 'USER': 'postgres', 'HOST': 'db',
+            'PORT': 5432, 'OPTIONS': {}, 'POOL': {'SIZE': 2}}
+        pool = get_pool('pool-test', settings_dict)
+        self.assertIs(get_pool('pool-test', dict(settings_dict)), pool)
+        connection = pool.acquire(self.connect)
+        in_use = pool.acquire(self.connect)
+        pool.release(connection)
+        test_pool = get_pool(
+            'pool-test', dict(settings_dict, NAME='test_foodgram'))
+        self.assertIsNot(test_pool, pool)
+        self.assertTrue(connection.closed)
+        pool.release(in_use)
+        self.assertTrue(in_use.closed)
+        self.assertIsNot(test_pool.acquire(self.connect), connection)
+
+    def test_similarity_threshold_once_per_connection(self):
+        wrapper = mock.MagicMock(connection=FakeConnection())
+        set_similarity_threshold(wrapper)
+        set_similarity_threshold(wrapper)
+        execute = wrapper.cursor.return_value.__enter__.return_value.execute
+        self.assertEqual(execute.call_count, 1)
+        wrapper.connection = FakeConnection()
+        set_similarity_threshold(wrapper)
+        self.assertEqual(execute.call_count, 2)
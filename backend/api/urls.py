@@ -1,6 +1,8 @@
+from django.conf import settings
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
+from api.async_views import async_patterns
 from api.views import (
     IngredientsViewSet,
     RecipesViewSet,
@@ -34,8 +36,12 @@ router_v1.register(
     basename='recipes',
 )
 
+router_urls = router_v1.urls
+if settings.ASYNC_VIEWS:
+    router_urls = async_patterns(router_urls)
+
 urlpatterns = [
-    path('', include(router_v1.urls)),
+    path('', include(router_urls)),
     path('', include('djoser.urls')),
     path('users/set_password/',
          SetPasswordView,
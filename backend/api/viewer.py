@@ -0,0 +1,90 @@
+from django.core.cache import cache
+from django.db import transaction
+
+from api.cache import bump_version, get_modified, get_version
+from core import constants
+from recipes.models import FavoriteRecipe, ShoppingCart
+from users.models import Subscribe
+
+
+VIEWER_VERSION = 'viewer-{user}'
+VIEWER_KEY = 'viewer:{user}:{version}'
+
+
+class ViewerContext:
+    '''Ids of the recipes and authors the viewer has marked'''
+    __slots__ = ('favorites', 'shopping_cart', 'subscriptions')
+
+    def __init__(self, favorites=(), shopping_cart=(), subscriptions=()):
+        self.favorites = frozenset(favorites)
+        self.shopping_cart = frozenset(shopping_cart)
+        self.subscriptions = frozenset(subscriptions)
+
+    @classmethod
+    def load(cls, user):
+        '''one query for each set'''
+        return cls(
+            FavoriteRecipe.objects.filter(
+                user=user).values_list('recipe_id', flat=True),
+            ShoppingCart.objects.filter(
+                user=user).values_list('recipe_id', flat=True),
+            Subscribe.objects.filter(
+                user=user).values_list('author_id', flat=True),
+        )
+
+    def __getstate__(self):
+        return (self.favorites, self.shopping_cart, self.subscriptions)
+
+    def __setstate__(self, state):
+        self.favorites, self.shopping_cart, self.subscriptions = state
+
+    def is_favorited(self, recipe_id):
+        return recipe_id in self.favorites
+
+    def is_in_shopping_cart(self, recipe_id):
+        return recipe_id in self.shopping_cart
+
+    def is_subscribed(self, author_id):
+        return author_id in self.subscriptions
+
+
+ANONYMOUS = ViewerContext()
+
+
+def viewer_key(request):
+    '''Part of the cache key for the responses with viewer flags'''
+    if request is None or not request.user.is_authenticated:
+        return 'anonymous'
+    user_id = request.user.id
+    return f'{user_id}-{get_version(VIEWER_VERSION.format(user=user_id))}'
+
+
+def viewer_modified(request):
+    '''Time of the last toggle of the viewer, None for the anonymous'''
+    if request is None or not request.user.is_authenticated:
+        return None
+    return get_modified(VIEWER_VERSION.format(user=request.user.id))
+
+
+def get_viewer(request):
+    '''Viewer context of the request, loaded once
+    and kept in the shared cache until the viewer toggles something'''
+    if request is None or not request.user.is_authenticated:
+        return ANONYMOUS
+    viewer = getattr(request, '_viewer', None)
+    if viewer is None:
+        user_id = request.user.id
+        version = get_version(VIEWER_VERSION.format(user=user_id))
+        key = VIEWER_KEY.format(user=user_id, version=version)
+        viewer = cache.get(key)
+        if viewer is None:
+            viewer = ViewerContext.load(request.user)
+            cache.set(key, viewer, timeout=constants.VIEWER_CACHE_TIMEOUT)
+        request._viewer = viewer
+    return viewer
+
+
+def invalidate_viewer(user_id):
+    '''Drop the cached viewer context once the toggle is committed'''
+    transaction.on_commit(
+        lambda: bump_version(VIEWER_VERSION.format(user=user_id)))
@@ -1,4 +1,6 @@
 from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import OuterRef, Prefetch, Subquery
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet as DjoserUserViewSet
 from rest_framework import filters, status, viewsets
@@ -9,19 +11,49 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.viewsets import ReadOnlyModelViewSet
 
+from api.cache import (
+    ReferenceDataCache,
+    ReferenceDataListMixin,
+    ResponseCacheMixin,
+)
 from api.filters import IngredientFilter, RecipeFilter
-from api.pagination import LimitPageNumberPagination
+from api.images import schedule_thumbnails
+from api.matching import recipe_matcher
+from api.pagination import (
+    CursorPaginationMixin,
+    LimitPageNumberPagination,
+    RecipeCursorPagination,
+    SubscribeCursorPagination,
+)
 from api.permissions import IsAdminOrReadOnly, IsAuthorOrReadOnly
+from api.representations import (
+    RecipeReadSerializer,
+    SubscribeReadSerializer,
+    fresh_tag,
+    ingredient_rows,
+    refresh_recipes,
+)
+from api.search import ingredient_index
 from api.serializers import (
     IngredientSerializer,
     FavoriteOrSubscribeSerializer,
+    RecipeBatchSerializer,
     RecipeSerializer,
+    RecipesLimitSerializer,
     SubscribeSerializer,
     TagSerializer,
     UserSerializer,
     UserPasswordSerializer,
 )
-from api.services import collect_shopping_cart
+from api.services import (
+    add_relations,
+    collect_shopping_cart,
+    remove_relations,
+)
+from api.viewer import viewer_key, viewer_modified
+from core import constants
+from recipes import feed as recipe_feed
+from recipes.counters import change_counter, change_counters
 from recipes.models import (
     FavoriteRecipe,
     Ingredient,
@@ -54,34 +86,54 @@ class SetPasswordView(APIView):
         )
 
 
-class UserViewSet(DjoserUserViewSet):
+class UserViewSet(CursorPaginationMixin, DjoserUserViewSet):
     '''Users and subscribes'''
     queryset = User.objects.all()
     serializer_class = UserSerializer
+    cursor_pagination_classes = {
+        'subscriptions': SubscribeCursorPagination,
+        'feed': RecipeCursorPagination,
+    }
     filter_backends = (DjangoFilterBackend, filters.SearchFilter,)
     search_fields = ('username', 'email')
     permission_classes = (AllowAny,)
 
-    @action(methods=['POST', 'DELETE'], detail=True,)
+    @action(methods=['POST', 'DELETE'], detail=True,
+            permission_classes=(IsAuthenticated, ))
     def subscribe(self, request, id):
         '''subscribe and unsubscribe'''
         author = get_object_or_404(User, id=id)
         if request.method == 'POST':
+            recipes_limit = self.get_recipes_limit()
             if request.user.id == author.id:
-                raise ValueError('You cant subscribe to yourself')
+                return Response(
+                    {'errors': 'You cant subscribe to yourself!'},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            with transaction.atomic():
+                added = add_relations(Subscribe, request.user, 'author',
+                                      [author.id], returning='id')
+                if added:
+                    change_counter(User, author.id, 'subscribers_count', 1)
+                    recipe_feed.backfill(request.user, author)
+            if not added:
+                return Response(
+                    {'errors': 'You already subscribe to this author!'},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
             serializer = SubscribeSerializer(
-                Subscribe.objects.create(user=request.user,
-                                         author=author),
-                context={'request': request})
+                Subscribe(id=added[0], user=request.user, author=author),
+                context={'request': request, 'recipes_limit': recipes_limit})
             return Response(serializer.data,
                             status=status.HTTP_201_CREATED)
         if request.method == 'DELETE':
-            if Subscribe.objects.filter(user=request.user,
-                                        author=author
-                                        ).exists():
-                Subscribe.objects.filter(user=request.user,
-                                         author=author
-                                         ).delete()
+            with transaction.atomic():
+                removed = remove_relations(Subscribe, request.user,
+                                           'author', [author.id])
+                if removed:
+                    change_counter(User, author.id, 'subscribers_count', -1)
+                    recipe_feed.unsubscribe(request.user, author)
+            if removed:
                 return Response(status=status.HTTP_204_NO_CONTENT)
             return Response(
                 {'errors': 'You cant unsubscribe from an author '
@@ -95,57 +147,183 @@ class UserViewSet(DjoserUserViewSet):
             )
     def subscriptions(self, request):
         '''Get user subscriptions'''
-        serializer = SubscribeSerializer(
-            self.paginate_queryset(Subscribe.objects.filter(
-                                   user=request.user)),
+        serializer = SubscribeReadSerializer(
+            self.paginate_queryset(self.get_subscriptions_queryset()),
             many=True, context={'request': request})
         return self.get_paginated_response(serializer.data)
 
+    @action(methods=['GET'],
+            detail=False,
+            permission_classes=(IsAuthenticated, )
+            )
+    def feed(self, request):
+        '''Recipes of the authors the user subscribes to'''
+        recipes = self.paginate_queryset(
+            recipe_feed.get_feed(request.user).with_related())
+        serializer = RecipeReadSerializer(
+            recipes, many=True, context=self.get_serializer_context())
+        return self.get_paginated_response(serializer.data)
+
+    def get_recipes_limit(self):
+        '''validated `recipes_limit`, None when it is not given'''
+        serializer = RecipesLimitSerializer(data=self.request.query_params)
+        serializer.is_valid(raise_exception=True)
+        return serializer.validated_data.get('recipes_limit')
+
+    def get_subscriptions_queryset(self):
+        '''subscriptions with authors and
+        the last `recipes_limit` recipes of every author on the page'''
+        recipes = RecipeList.objects.all()
+        recipes_limit = self.get_recipes_limit()
+        if recipes_limit is not None:
+            recipes = recipes.filter(pk__in=Subquery(
+                RecipeList.objects.filter(
+                    author=OuterRef('author')
+                ).values('pk')[:recipes_limit]
+            ))
+        return Subscribe.objects.filter(
+            user=self.request.user
+        ).select_related('author').prefetch_related(
+            Prefetch('author__recipes', queryset=recipes,
+                     to_attr='subscription_recipes')
+        )
 
-class TagsViewSet(ReadOnlyModelViewSet):
+
+class TagsViewSet(ReferenceDataListMixin, ReadOnlyModelViewSet):
     '''List of tags'''
     queryset = Tag.objects.all()
     permission_classes = (IsAdminOrReadOnly,)
     serializer_class = TagSerializer
     pagination_class = None
+    reference_cache = ReferenceDataCache(
+        'tags',
+        lambda: TagSerializer(Tag.objects.all(), many=True).data,
+    )
 
 
-class IngredientsViewSet(ReadOnlyModelViewSet):
+class IngredientsViewSet(ReferenceDataListMixin, ReadOnlyModelViewSet):
     '''LIst of ingredients'''
     queryset = Ingredient.objects.all()
+    reference_cache = ReferenceDataCache(
+        'ingredients',
+        lambda: ingredient_rows(Ingredient.objects.all()),
+    )
     permission_classes = (IsAdminOrReadOnly,)
     serializer_class = IngredientSerializer
     filter_backends = (IngredientFilter,)
     search_fields = ('^name',)
     pagination_class = None
 
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if name:
+            return Response(ingredient_index.search(name))
+        return super().list(request, *args, **kwargs)
+
 
-class RecipesViewSet(viewsets.ModelViewSet):
+class RecipesViewSet(ResponseCacheMixin, CursorPaginationMixin,
+                     viewsets.ModelViewSet):
     '''List of recipes'''
     queryset = RecipeList.objects.all()
     serializer_class = RecipeSerializer
     pagination_class = LimitPageNumberPagination
+    cursor_pagination_classes = {'list': RecipeCursorPagination}
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
     permission_classes = (IsAuthorOrReadOnly, )
+    response_cache_name = 'recipes'
+    response_fresh_name = 'recipe-fresh'
+
+    def get_viewer_key(self, request):
+        return viewer_key(request)
+
+    def get_viewer_modified(self, request):
+        return viewer_modified(request)
+
+    @staticmethod
+    def cached_recipes(data):
+        '''recipe representations of the list page or the detail'''
+        return data['results'] if 'results' in data else [data]
+
+    def refresh_cached_data(self, data):
+        refresh_recipes(self.cached_recipes(data))
 
+    def get_fresh_tag(self, data):
+        return f'-{fresh_tag(self.cached_recipes(data))}'
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ('list', 'retrieve', 'match'):
+            return queryset.with_related()
+        return queryset
+
+    def get_serializer_class(self):
+        if self.action in ('list', 'retrieve', 'match'):
+            return RecipeReadSerializer
+        return super().get_serializer_class()
+
+    @transaction.atomic
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user,)
+        recipe = serializer.save(author=self.request.user,)
+        change_counter(User, self.request.user.id, 'recipes_count', 1)
+        schedule_thumbnails(recipe.image)
+        transaction.on_commit(lambda: recipe_feed.fan_out(recipe))
+
+    def perform_update(self, serializer):
+        recipe = serializer.save()
+        schedule_thumbnails(recipe.image)
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        instance.delete()
+        change_counter(User, instance.author_id, 'recipes_count', -1)
 
     def new_favorite_or_cart(self, model, user, pk):
         recipe = get_object_or_404(RecipeList, id=pk)
-        model.objects.create(user=user, recipe=recipe)
+        with transaction.atomic():
+            added = add_relations(model, user, 'recipe', [recipe.id])
+            change_counters(RecipeList, added, model.counter_field, 1)
+        if not added:
+            return Response({'errors': 'The recipe has already been added!'},
+                            status=status.HTTP_400_BAD_REQUEST)
         serializer = FavoriteOrSubscribeSerializer(recipe)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     def remove_favorite_or_cart(self, model, user, pk):
-        obj = model.objects.filter(user=user, recipe__id=pk)
-        if obj.exists():
-            obj.delete()
+        recipe = get_object_or_404(RecipeList, id=pk)
+        with transaction.atomic():
+            removed = remove_relations(model, user, 'recipe', [recipe.id])
+            change_counters(RecipeList, removed, model.counter_field, -1)
+        if removed:
             return Response(status=status.HTTP_204_NO_CONTENT)
         return Response({'errors': 'The recipe has already been deleted!'},
                         status=status.HTTP_400_BAD_REQUEST)
 
+    def bulk_favorite_or_cart(self, model, request):
+        '''add or remove many recipes, report the status of every id'''
+        serializer = RecipeBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['recipes']
+        found = set(RecipeList.objects.filter(
+            id__in=ids).values_list('id', flat=True))
+        with transaction.atomic():
+            if request.method == 'POST':
+                changed = add_relations(model, request.user, 'recipe',
+                                        list(found))
+                delta, done, skipped = 1, 'added', 'already_added'
+            else:
+                changed = remove_relations(model, request.user, 'recipe',
+                                           list(found))
+                delta, done, skipped = -1, 'removed', 'not_added'
+            change_counters(RecipeList, changed, model.counter_field, delta)
+        changed = set(changed)
+        return Response({'recipes': [
+            {'id': id,
+             'status': (done if id in changed
+                        else skipped if id in found else 'not_found')}
+            for id in ids
+        ]})
+
     @action(detail=True, methods=['POST', 'DELETE'],
             permission_classes=[IsAuthenticated])
     def favorite(self, request, pk=None):
@@ -164,11 +342,62 @@ class RecipesViewSet(viewsets.ModelViewSet):
             return self.new_favorite_or_cart(ShoppingCart, request.user, pk)
         return self.remove_favorite_or_cart(ShoppingCart, request.user, pk)
 
+    @action(detail=False, methods=['POST', 'DELETE'], url_path='favorite',
+            permission_classes=[IsAuthenticated])
+    def favorite_bulk(self, request):
+        '''Add many recipes to favorites or delete them'''
+        return self.bulk_favorite_or_cart(FavoriteRecipe, request)
+
+    @action(detail=False, methods=['POST', 'DELETE'],
+            url_path='shopping_cart',
+            permission_classes=[IsAuthenticated])
+    def shopping_cart_bulk(self, request):
+        '''Add many recipes to your shopping list or remove them from it'''
+        return self.bulk_favorite_or_cart(ShoppingCart, request)
+
+    @action(detail=False, methods=['GET'])
+    def match(self, request):
+        '''Recipes which can be cooked from the given ingredients'''
+        params = request.query_params
+        try:
+            ingredient_ids = [int(id) for id in params.getlist('ingredients')]
+            max_cooking_time = params.get('max_cooking_time')
+            if max_cooking_time is not None:
+                max_cooking_time = int(max_cooking_time)
+        except ValueError:
+            return Response(
+                {'errors': 'Ingredients and cooking time must be integers!'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        tag_ids = None
+        if params.getlist('tags'):
+            tag_ids = set(Tag.objects.filter(
+                slug__in=params.getlist('tags')).values_list('id', flat=True))
+        page = self.paginate_queryset(recipe_matcher.match(
+            ingredient_ids, tag_ids, max_cooking_time))
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for recipe_id, _, _ in page])
+        data = []
+        for recipe_id, matched, missing in page:
+            if recipe_id in recipes:
+                item = self.get_serializer(recipes[recipe_id]).data
+                item['matched_count'] = matched
+                item['missing_count'] = missing
+                data.append(item)
+        return self.get_paginated_response(data)
+
     @action(detail=False, methods=['GET'],
             permission_classes=(IsAuthenticated,))
     def download_shopping_cart(self, request):
         '''Download shopping cart'''
         user = request.user
+        file_format = request.query_params.get(
+            'file_format', constants.DEFAULT_SHOPPING_LIST_FORMAT)
+        if file_format not in constants.SHOPPING_LIST_FORMATS:
+            return Response(
+                {'errors': f'Unknown file format {file_format}!'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
         if not user.shopping_cart.exists():
             return Response(status=status.HTTP_400_BAD_REQUEST)
-        return collect_shopping_cart(request)
+        return collect_shopping_cart(request, file_format)
@@ -1,6 +1,39 @@
-OUTPUT_FILENAME = 'shopping_list.txt'
+OUTPUT_FILENAME = 'shopping_list'
+SHOPPING_LIST_FORMATS = {
+    'txt': 'text/plain',
+    'csv': 'text/csv',
+    'json': 'application/json',
+}
+DEFAULT_SHOPPING_LIST_FORMAT = 'txt'
 
 DEFAULT_PAGE_SIZE = 6
+APPROXIMATE_COUNT_THRESHOLD = 100_000
+
+REFERENCE_CACHE_TIMEOUT = 60 * 60 * 24
+AUTH_CACHE_TIMEOUT = 60
+AUTH_CACHE_SIZE = 10_000
+VIEWER_CACHE_TIMEOUT = 60 * 60
+RESPONSE_CACHE_TIMEOUT = 60 * 10
+INGREDIENT_SEARCH_LIMIT = 50
+SEARCH_CONFIG = 'russian'
+SEARCH_TRIGRAM_THRESHOLD = 0.3
+
+MAX_IMAGE_SIZE = 10 * 2 ** 20
+MAX_IMAGE_DIMENSION = 8000
+IMAGE_DECODE_CHUNK = 64 * 2 ** 10
+IMAGE_SPOOL_SIZE = 2 ** 20
+THUMBNAIL_SIZES = (320, 640)
+LIST_THUMBNAIL_SIZE = 640
+THUMBNAIL_QUALITY = 80
+THUMBNAIL_WORKERS = 2
+
+FEED_MAX_LENGTH = 1000
+FEED_FANOUT_LIMIT = 10_000
+FEED_BATCH_SIZE = 1000
+
+BATCH_MAX_SIZE = 100
+
+METRICS_DUPLICATE_QUERIES = 10
 
 MIN_INGREDIENT_AMOUNT = 1
 MIN_COOKING_TIME = 1
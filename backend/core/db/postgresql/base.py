@@ -0,0 +1,227 @@
+import os
+import threading
+import time
+from functools import partial
+
+from django.db.backends.postgresql import base
+from psycopg2 import extensions
+
+from core.db.stats import stats
+
+
+Database = base.Database
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class ConnectionPool:
+    '''Server connections shared by the threads of this worker'''
+
+    def __init__(self, alias, size, timeout, max_age=None,
+                 health_checks=False):
+        self.alias = alias
+        self.size = size
+        self.timeout = timeout
+        self.max_age = max_age
+        self.health_checks = health_checks
+        self.in_use = 0
+        self.waiting = 0
+        self.closed = False
+        self._idle = []
+        self._opened_at = {}
+        self._condition = threading.Condition()
+
+    def state(self):
+        '''size, in use, idle and waiting'''
+        with self._condition:
+            return self.size, self.in_use, len(self._idle), self.waiting
+
+    def acquire(self, connect):
+        '''An idle connection or a new one made by `connect`'''
+        with self._condition:
+            if self.in_use >= self.size:
+                self.wait()
+            self.in_use += 1
+        try:
+            while True:
+                with self._condition:
+                    connection = self._idle.pop() if self._idle else None
+                if connection is None:
+                    break
+                if self.usable(connection):
+                    stats.add(self.alias, 'connections_reused')
+                    return connection
+                self.discard(connection)
+            connection = connect()
+        except BaseException:
+            self.release_slot()
+            raise
+        stats.add(self.alias, 'connections_opened')
+        self._opened_at[connection] = time.monotonic()
+        return connection
+
+    def wait(self):
+        '''Wait with the lock held until a slot is free or time is out'''
+        start = time.monotonic()
+        deadline = start + self.timeout
+        self.waiting += 1
+        try:
+            while self.in_use >= self.size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    stats.add(self.alias, 'pool_timeouts')
+                    raise Database.OperationalError(
+                        f'No free connection in the pool of "{self.alias}" '
+                        f'after {self.timeout} seconds')
+                self._condition.wait(remaining)
+        finally:
+            self.waiting -= 1
+            stats.add(self.alias, 'pool_waits')
+            stats.add(self.alias, 'pool_wait_seconds',
+                      time.monotonic() - start)
+
+    def usable(self, connection):
+        if self.expired(connection):
+            return False
+        if not self.health_checks:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+        except Database.Error:
+            stats.add(self.alias, 'health_check_failures')
+            return False
+        return True
+
+    def expired(self, connection):
+        return self.max_age is not None and (
+            time.monotonic() - self._opened_at.get(connection, 0)
+            >= self.max_age)
+
+    def release(self, connection):
+        '''Take the connection back, rolled back, or close it'''
+        keep = not (self.closed or connection.closed
+                    or self.expired(connection))
+        if keep:
+            status = connection.get_transaction_status()
+            if status in (extensions.TRANSACTION_STATUS_INTRANS,
+                          extensions.TRANSACTION_STATUS_INERROR):
+                try:
+                    connection.rollback()
+                except Database.Error:
+                    keep = False
+            elif status != extensions.TRANSACTION_STATUS_IDLE:
+                keep = False
+        if keep:
+            with self._condition:
+                self._idle.append(connection)
+        else:
+            self.discard(connection)
+        self.release_slot()
+
+    def release_slot(self):
+        with self._condition:
+            self.in_use -= 1
+            self._condition.notify()
+
+    def discard(self, connection):
+        self._opened_at.pop(connection, None)
+        try:
+            connection.close()
+        except Database.Error:
+            pass
+
+    def close(self):
+        '''Close the idle connections, the ones in use are closed
+        when they are released'''
+        with self._condition:
+            self.closed = True
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            self.discard(connection)
+
+
+def pool_key(alias, settings_dict):
+    '''The pool is shared by the connections to the same server database
+    of this process, new after a fork or a change of the parameters'''
+    return (alias, os.getpid(), settings_dict['NAME'],
+            settings_dict['USER'], settings_dict['HOST'],
+            str(settings_dict['PORT']),
+            repr(sorted(settings_dict['OPTIONS'].items())))
+
+
+def get_pool(alias, settings_dict):
+    '''The pool of the database in this process'''
+    key = pool_key(alias, settings_dict)
+    pool = _pools.get(key)
+    if pool is not None:
+        return pool
+    with _pools_lock:
+        if key not in _pools:
+            stale = [other for other in _pools
+                     if other[:2] == key[:2] and other != key]
+            for other in stale:
+                _pools.pop(other).close()
+            options = settings_dict['POOL']
+            _pools[key] = stats.pools[alias] = ConnectionPool(
+                alias, options['SIZE'], options.get('TIMEOUT', 30),
+                max_age=options.get('MAX_AGE'),
+                health_checks=settings_dict.get('CONN_HEALTH_CHECKS', False),
+            )
+        return _pools[key]
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    '''PostgreSQL backend with the health checks of persistent connections
+    and an optional pool of the connections shared by threads.
+
+    `CONN_HEALTH_CHECKS` pings a reused connection before its first query
+    in a request. `POOL = {'SIZE': ..., 'TIMEOUT': ..., 'MAX_AGE': ...}`
+    hands the connections closed by a thread over to the other threads
+    instead of closing them.'''
+    health_check_done = False
+
+    @property
+    def pool(self):
+        if not self.settings_dict.get('POOL'):
+            return None
+        return get_pool(self.alias, self.settings_dict)
+
+    def get_new_connection(self, conn_params):
+        connect = partial(super().get_new_connection, conn_params)
+        pool = self.pool
+        if pool is None:
+            connection = connect()
+            stats.add(self.alias, 'connections_opened')
+            return connection
+        connection = pool.acquire(connect)
+        self.isolation_level = self.settings_dict['OPTIONS'].get(
+            'isolation_level', connection.isolation_level)
+        return connection
+
+    def connect(self):
+        super().connect()
+        self.health_check_done = True
+
+    def ensure_connection(self):
+        if self.connection is not None and not self.health_check_done:
+            self.health_check_done = True
+            stats.add(self.alias, 'connections_reused')
+            if (self.settings_dict.get('CONN_HEALTH_CHECKS')
+                    and not self.in_atomic_block and not self.is_usable()):
+                stats.add(self.alias, 'health_check_failures')
+                self.close()
+        super().ensure_connection()
+
+    def close_if_unusable_or_obsolete(self):
+        '''called when a request starts and finishes'''
+        self.health_check_done = False
+        super().close_if_unusable_or_obsolete()
+
+    def _close(self):
+        pool = self.pool
+        if self.connection is None or pool is None:
+            return super()._close()
+        with self.wrap_database_errors:
+            pool.release(self.connection)
@@ -0,0 +1,33 @@
+import threading
+from collections import Counter, defaultdict
+
+
+class ConnectionStats:
+    '''Database connection counters and pools of this worker'''
+    counters = (
+        ('connections_opened', 'Database connections opened'),
+        ('connections_reused', 'Open database connections taken for reuse'),
+        ('health_check_failures',
+         'Persistent connections dropped by the health check'),
+        ('pool_waits', 'Requests which waited for a free pool slot'),
+        ('pool_wait_seconds', 'Time spent waiting for a free pool slot'),
+        ('pool_timeouts', 'Waits for a free pool slot which timed out'),
+    )
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = defaultdict(Counter)
+        self.pools = {}
+
+    def add(self, alias, name, value=1):
+        with self._lock:
+            self._values[alias][name] += value
+
+    def snapshot(self):
+        '''alias -> counter values'''
+        with self._lock:
+            return {alias: Counter(values)
+                    for alias, values in self._values.items()}
+
+
+stats = ConnectionStats()
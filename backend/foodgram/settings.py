@@ -28,6 +28,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'corsheaders',
     'djoser',
@@ -39,6 +40,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -49,6 +51,8 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+METRICS_SAMPLE_RATE = float(os.getenv('METRICS_SAMPLE_RATE', '0'))
+
 CORS_ORIGIN_ALLOW_ALL = True
 CORS_URLS_REGEX = r'^/api/.*$'
 
@@ -71,19 +75,64 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'foodgram.wsgi.application'
+ASGI_APPLICATION = 'foodgram.asgi.application'
+ASYNC_VIEWS = bool(strtobool(os.getenv('ASYNC_VIEWS', 'false')))
 
 
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
+# Persistent connections live DB_CONN_MAX_AGE seconds, 0 closes them at the
+# end of every request. With DB_POOL_SIZE the threads of a worker share at
+# most that many connections and give them back after every request, then
+# DB_CONN_MAX_AGE is the age at which the pool replaces a connection.
+DB_CONN_MAX_AGE = int(os.getenv('DB_CONN_MAX_AGE', 60))
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 0))
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': 'core.db.postgresql',
         'NAME': os.getenv('POSTGRES_DB', 'django_user'),
         'USER': os.getenv('POSTGRES_USER', 'django_password'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
         'HOST': os.getenv('DB_HOST', ''),
-        'PORT': os.getenv('DB_PORT', 5432)
+        'PORT': os.getenv('DB_PORT', 5432),
+        'CONN_MAX_AGE': 0 if DB_POOL_SIZE else DB_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': bool(
+            strtobool(os.getenv('DB_HEALTH_CHECKS', 'true'))),
+        'OPTIONS': {
+            'connect_timeout': int(os.getenv('DB_CONNECT_TIMEOUT', 5)),
+        },
+    }
+}
+
+if DB_POOL_SIZE:
+    DATABASES['default']['POOL'] = {
+        'SIZE': DB_POOL_SIZE,
+        'TIMEOUT': float(os.getenv('DB_POOL_TIMEOUT', 10)),
+        'MAX_AGE': DB_CONN_MAX_AGE or None,
+    }
+
+if os.getenv('DB_ENGINE') == 'sqlite':
+    DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.getenv('SQLITE_PATH', os.path.join(BASE_DIR, 'db.sqlite3')),
+    }
+
+# gunicorn and uvicorn take the number of worker processes from here
+WEB_CONCURRENCY = int(os.getenv('WEB_CONCURRENCY', 1))
+
+# the versions of the cached data must be shared by all worker processes:
+# memcached at CACHE_LOCATION, the process memory only for a single worker
+CACHE_LOCATION = os.getenv('CACHE_LOCATION', '')
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.memcached.PyMemcacheCache'
+            if CACHE_LOCATION else
+            'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': CACHE_LOCATION,
     }
 }
 
@@ -142,8 +191,17 @@ ACCOUNT_USERNAME_REQUIRED = False
 ACCOUNT_AUTHENTICATION_METHOD = 'email'
 
 REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        *(['rest_framework.renderers.BrowsableAPIRenderer'] if DEBUG else []),
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'api.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachingTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
@@ -157,9 +215,13 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': constants.DEFAULT_PAGE_SIZE,
 }
 
+# A password change deletes the user's token: DRF tokens do not depend on the
+# password, so without it a leaked token would outlive the change. The
+# frontend sends the user to the sign-in page after set_password anyway.
 DJOSER = {
     'LOGIN_FIELD': 'email',
     'HIDE_USERS': False,
+    'LOGOUT_ON_PASSWORD_CHANGE': True,
     'SERIALIZERS': {'user': 'api.serializers.UserSerializer'},
     'PERMISSIONS': {'user': ['rest_framework.permissions.IsAuthenticated'],
                     'user_list': ['rest_framework.permissions.AllowAny']}}
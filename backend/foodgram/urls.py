@@ -3,10 +3,13 @@ from django.conf import settings
 from django.conf.urls.static import static
 from django.urls import include, path
 
+from api.metrics import metrics_view
+
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('api/', include('api.urls', namespace='api'))
+    path('api/', include('api.urls', namespace='api')),
+    path('metrics/', metrics_view, name='metrics'),
 ]
 
 if settings.DEBUG:
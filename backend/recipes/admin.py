@@ -1,4 +1,7 @@
 from django.contrib import admin
+from django.db import transaction
+
+from api.cache import bump_version
 
 from recipes.models import (
     Ingredient,
@@ -8,6 +11,7 @@ from recipes.models import (
     ShoppingCart,
     Tag,
 )
+from recipes.search import search_recipes
 
 
 EMPTY_STRING: str = '-empty-'
@@ -22,15 +26,27 @@ class RecipeIngredientsAdmin(admin.StackedInline):
 class RecipeListAdmin(admin.ModelAdmin):
     inlines = (RecipeIngredientsAdmin,)
     list_display = ('author', 'name', 'text', 'get_favorite_count')
+    list_select_related = ('author',)
     search_fields = (
-        'name', 'cooking_time',
-        'author__username', 'ingredients__name'
+        'name', 'cooking_time', 'author__username',
     )
     list_filter = (
         'pub_date', 'tags',
     )
     empty_value_display = EMPTY_STRING
 
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        transaction.on_commit(lambda: bump_version('recipe-ingredients'))
+
+    def get_search_results(self, request, queryset, search_term):
+        found, use_distinct = super().get_search_results(
+            request, queryset, search_term)
+        if search_term:
+            found |= queryset.filter(pk__in=search_recipes(
+                RecipeList.objects.all(), search_term).values('pk'))
+        return found, use_distinct
+
     @admin.display(
         description='email of author'
     )
@@ -52,7 +68,7 @@ class RecipeListAdmin(admin.ModelAdmin):
 
     @admin.display(description='In favorite')
     def get_favorite_count(self, obj):
-        return obj.favorites.count()
+        return obj.favorites_count
 
 
 @admin.register(Tag)
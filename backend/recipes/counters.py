@@ -0,0 +1,68 @@
+from django.apps import apps
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.dispatch import Signal
+
+
+COUNTERS = (
+    ('recipes.RecipeList', 'favorites_count',
+     'recipes.FavoriteRecipe', 'recipe'),
+    ('recipes.RecipeList', 'shopping_cart_count',
+     'recipes.ShoppingCart', 'recipe'),
+    ('users.User', 'recipes_count',
+     'recipes.RecipeList', 'author'),
+    ('users.User', 'subscribers_count',
+     'users.Subscribe', 'author'),
+)
+
+# sent with the model and the counter field after the counters are changed
+counters_changed = Signal()
+
+
+def change_counter(model, pk, field, delta):
+    '''Atomically change a denormalized counter of the row'''
+    queryset = model.objects.filter(pk=pk)
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    changed = queryset.update(**{field: F(field) + delta})
+    if changed:
+        counters_changed.send(sender=model, field=field)
+    return changed
+
+
+def change_counters(model, pks, field, delta):
+    '''Atomically change a denormalized counter of the rows'''
+    queryset = model.objects.filter(pk__in=pks)
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    changed = queryset.update(**{field: F(field) + delta})
+    if changed:
+        counters_changed.send(sender=model, field=field)
+    return changed
+
+
+def count_of(model, field):
+    '''Number of rows of `model` which refer to the outer row by `field`'''
+    return Coalesce(
+        Subquery(
+            model.objects.filter(
+                **{field: OuterRef('pk')}
+            ).order_by().values(field).annotate(
+                count=Count('pk')
+            ).values('count')
+        ),
+        0,
+    )
+
+
+def recount():
+    '''Repair all counters in bulk, return the number of fixed rows'''
+    fixed = {}
+    for model_name, field, related_model_name, related_field in COUNTERS:
+        model = apps.get_model(model_name)
+        actual = count_of(apps.get_model(related_model_name), related_field)
+        fixed[f'{model_name}.{field}'] = model.objects.exclude(
+            **{field: actual}).update(**{field: actual})
+        if fixed[f'{model_name}.{field}']:
+            counters_changed.send(sender=model, field=field)
+    return fixed
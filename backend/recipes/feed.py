@@ -0,0 +1,142 @@
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.db import connections, router
+from django.db.models import Exists, OuterRef, Q
+
+from core import constants
+from recipes.models import FeedEntry, RecipeList
+from users.models import Subscribe
+
+
+User = get_user_model()
+
+
+def is_pulled(author_id):
+    '''recipes of popular authors are read on request, not fanned out,
+    the count is read from the database, not from a cached user'''
+    return User.objects.filter(
+        pk=author_id,
+        subscribers_count__gt=constants.FEED_FANOUT_LIMIT,
+    ).exists()
+
+
+def batches(values, size=constants.FEED_BATCH_SIZE):
+    '''lists of `size` values'''
+    iterator = iter(values)
+    batch = list(islice(iterator, size))
+    while batch:
+        yield batch
+        batch = list(islice(iterator, size))
+
+
+def fan_out(recipe):
+    '''Put a new recipe into the feeds of the author subscribers'''
+    if is_pulled(recipe.author_id):
+        return
+    subscribers = Subscribe.objects.filter(
+        author=recipe.author_id).values_list('user_id', flat=True)
+    for user_ids in batches(subscribers.iterator()):
+        FeedEntry.objects.bulk_create(
+            [FeedEntry(user_id=user_id, recipe=recipe,
+                       pub_date=recipe.pub_date)
+             for user_id in user_ids],
+            ignore_conflicts=True,
+        )
+        trim_all(user_ids)
+
+
+def backfill(user, author):
+    '''Put the last recipes of the author into the user feed'''
+    if is_pulled(author.id):
+        return
+    recipes = RecipeList.objects.filter(author=author).values_list(
+        'id', 'pub_date')[:constants.FEED_MAX_LENGTH]
+    FeedEntry.objects.bulk_create(
+        (FeedEntry(user_id=user.id, recipe_id=recipe_id, pub_date=pub_date)
+         for recipe_id, pub_date in recipes),
+        batch_size=constants.FEED_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    trim(user)
+
+
+def unpull(author):
+    '''Put the last recipes of the author who is not popular any more
+    into the feeds of all subscribers: the ones published
+    while the author was pulled were never fanned out'''
+    recipes = list(RecipeList.objects.filter(author=author).values_list(
+        'id', 'pub_date')[:constants.FEED_MAX_LENGTH])
+    if not recipes:
+        return
+    subscribers = Subscribe.objects.filter(
+        author=author).values_list('user_id', flat=True)
+    size = max(1, constants.FEED_BATCH_SIZE // len(recipes))
+    for user_ids in batches(subscribers.iterator(), size):
+        FeedEntry.objects.bulk_create(
+            [FeedEntry(user_id=user_id, recipe_id=recipe_id,
+                       pub_date=pub_date)
+             for user_id in user_ids for recipe_id, pub_date in recipes],
+            ignore_conflicts=True,
+        )
+        trim_all(user_ids)
+
+
+def unsubscribe(user, author):
+    '''Remove recipes of the author from the user feed,
+    materialize the author who has just stopped being pulled'''
+    FeedEntry.objects.filter(user=user, recipe__author=author).delete()
+    if User.objects.filter(
+            pk=author.id,
+            subscribers_count=constants.FEED_FANOUT_LIMIT).exists():
+        unpull(author)
+
+
+def trim(user):
+    '''Keep only FEED_MAX_LENGTH last entries of the user feed'''
+    FeedEntry.objects.filter(pk__in=FeedEntry.objects.filter(
+        user=user).order_by('-pub_date', '-recipe_id').values(
+        'pk')[constants.FEED_MAX_LENGTH:]).delete()
+
+
+def trim_all(user_ids=None):
+    '''Keep only FEED_MAX_LENGTH last entries of the feeds of the users
+    or of every feed, return the number of removed entries'''
+    connection = connections[router.db_for_write(FeedEntry)]
+    quote = connection.ops.quote_name
+    table = quote(FeedEntry._meta.db_table)
+    pk = quote(FeedEntry._meta.pk.column)
+    user = quote(FeedEntry._meta.get_field('user').column)
+    recipe = quote(FeedEntry._meta.get_field('recipe').column)
+    pub_date = quote(FeedEntry._meta.get_field('pub_date').column)
+    where, params = '', []
+    if user_ids is not None:
+        if not user_ids:
+            return 0
+        where = f'WHERE {user} IN ({", ".join(["%s"] * len(user_ids))}) '
+        params = list(user_ids)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {table} WHERE {pk} IN ('
+            f'SELECT {pk} FROM (SELECT {pk}, ROW_NUMBER() OVER ('
+            f'PARTITION BY {user} ORDER BY {pub_date} DESC, {recipe} DESC'
+            f') AS position FROM {table} {where}) AS entries '
+            f'WHERE position > %s)',
+            [*params, constants.FEED_MAX_LENGTH],
+        )
+        return cursor.rowcount
+
+
+def get_feed(user):
+    '''Recipes of the followed authors: materialized ones
+    and the pulled recipes of popular authors'''
+    pulled = list(Subscribe.objects.filter(
+        user=user,
+        author__subscribers_count__gt=constants.FEED_FANOUT_LIMIT,
+    ).values_list('author_id', flat=True))
+    if not pulled:
+        return RecipeList.objects.filter(feed_entries__user=user)
+    return RecipeList.objects.filter(
+        Exists(FeedEntry.objects.filter(user=user, recipe=OuterRef('pk')))
+        | Q(author__in=pulled)
+    )
@@ -0,0 +1,104 @@
+import csv
+import io
+import json
+import os
+from itertools import islice
+
+from django.db import connection, transaction
+
+from api.cache import bump_version
+from recipes.models import Ingredient, Tag
+
+
+class BulkLoader:
+    '''Load seeds in batches skipping the rows which already exist'''
+
+    def __init__(self, name, model, fields, key):
+        self.name = name
+        self.model = model
+        self.fields = fields
+        self.key = key
+
+    def read(self, path):
+        '''rows of a json or csv file as dicts'''
+        with open(path, encoding='utf-8', newline='') as file:
+            if os.path.splitext(path)[1].lower() == '.csv':
+                for row in csv.reader(file):
+                    if row and tuple(row) != self.fields:
+                        yield dict(zip(self.fields, row))
+            else:
+                yield from json.load(file)
+
+    def unique(self, rows):
+        '''rows which are not in the database and not repeated in the file'''
+        seen = set(self.model.objects.values_list(*self.key))
+        for row in rows:
+            key = tuple(row[field] for field in self.key)
+            if key not in seen:
+                seen.add(key)
+                yield row
+
+    def batches(self, rows, batch_size):
+        rows = iter(rows)
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                return
+            yield batch
+
+    def insert(self, batch):
+        self.model.objects.bulk_create(
+            [self.model(**{field: row[field] for field in self.fields})
+             for row in batch],
+            ignore_conflicts=True,
+        )
+
+    def copy(self, batch):
+        '''insert the batch with postgres COPY'''
+        table = self.model._meta.db_table
+        columns = ', '.join(self.fields)
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerows([row[field] for field in self.fields]
+                         for row in batch)
+        buffer.seek(0)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE TEMP TABLE IF NOT EXISTS load_{table} '
+                f'(LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP'
+            )
+            cursor.execute(f'TRUNCATE load_{table}')
+            cursor.copy_expert(
+                f'COPY load_{table} ({columns}) FROM STDIN WITH CSV', buffer)
+            cursor.execute(
+                f'INSERT INTO {table} ({columns}) '
+                f'SELECT {columns} FROM load_{table} ON CONFLICT DO NOTHING'
+            )
+
+    def load(self, path, batch_size, use_copy=False):
+        '''load the file in one transaction, return the number of rows'''
+        write = self.insert
+        if use_copy and connection.vendor == 'postgresql':
+            write = self.copy
+        count = 0
+        with transaction.atomic():
+            for batch in self.batches(self.unique(self.read(path)),
+                                      batch_size):
+                write(batch)
+                count += len(batch)
+            transaction.on_commit(lambda: bump_version(self.name))
+        return count
+
+
+LOADERS = {
+    'ingredients': BulkLoader(
+        'ingredients', Ingredient,
+        fields=('name', 'measurement_unit'),
+        key=('name', 'measurement_unit'),
+    ),
+    'tags': BulkLoader(
+        'tags', Tag,
+        fields=('name', 'color', 'slug'),
+        key=('slug',),
+    ),
+}
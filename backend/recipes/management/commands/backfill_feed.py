@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes import feed
+from users.models import Subscribe
+
+
+class Command(BaseCommand):
+    help = 'Fill the feeds from the existing subscriptions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help='id of one user')
+
+    def handle(self, *args, **options):
+        subscriptions = Subscribe.objects.select_related('user', 'author')
+        if options['user']:
+            subscriptions = subscriptions.filter(user=options['user'])
+        users = set()
+        for subscription in subscriptions.order_by('user').iterator():
+            with transaction.atomic():
+                feed.backfill(subscription.user, subscription.author)
+            users.add(subscription.user)
+        self.stdout.write(self.style.SUCCESS(
+            f'Feeds of {len(users)} users are filled'))
@@ -0,0 +1,173 @@
+import itertools
+import os
+import random
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.cache import bump_version
+from recipes.counters import recount
+from recipes.loaders import LOADERS
+from recipes.models import (
+    FavoriteRecipe,
+    Ingredient,
+    IngredientInRecipe,
+    RecipeList,
+    ShoppingCart,
+    Tag,
+)
+from recipes.search import update_search_vectors
+from users.models import Subscribe
+
+
+User = get_user_model()
+
+TAGS = (
+    ('Завтрак', '#E26C2D', 'breakfast'),
+    ('Обед', '#49B64E', 'lunch'),
+    ('Ужин', '#8775D2', 'dinner'),
+    ('Десерт', '#F5C242', 'dessert'),
+    ('Выпечка', '#B5651D', 'bakery'),
+    ('Суп', '#2D9CDB', 'soup'),
+)
+WORDS = ('суп', 'салат', 'пирог', 'каша', 'рагу', 'запеканка', 'котлеты',
+         'омлет', 'паста', 'плов', 'блины', 'соус', 'жаркое', 'компот')
+
+
+def zipf_weights(size, exponent=1.1):
+    '''cumulative weights of a power-law popularity of `size` items'''
+    return list(itertools.accumulate(
+        1 / (rank + 1) ** exponent for rank in range(size)))
+
+
+class Command(BaseCommand):
+    help = 'Generate synthetic users, recipes and relations for benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=5000)
+        parser.add_argument('--subscriptions', type=float, default=5,
+                            help='mean subscriptions per user')
+        parser.add_argument('--favorites', type=float, default=10,
+                            help='mean favorites per user')
+        parser.add_argument('--cart', type=float, default=5,
+                            help='mean shopping cart recipes per user')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--ingredients-file',
+            default=os.path.join(settings.BASE_DIR, 'data',
+                                 'ingredients.csv'))
+
+    def skewed_count(self, mean, limit):
+        '''power-law count with the given mean'''
+        return min(limit, int(mean * (self.random.paretovariate(2) - 1)))
+
+    def pick(self, population, cum_weights, count):
+        '''`count` distinct popular items of the population'''
+        count = min(count, len(population))
+        picked = set()
+        while len(picked) < count:
+            picked.update(self.random.choices(
+                population, cum_weights=cum_weights, k=count - len(picked)))
+        return picked
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        batch_size = options['batch_size']
+        if not Ingredient.objects.exists():
+            LOADERS['ingredients'].load(options['ingredients_file'],
+                                        batch_size)
+        Tag.objects.bulk_create(
+            [Tag(name=name, color=color, slug=slug)
+             for name, color, slug in TAGS],
+            ignore_conflicts=True,
+        )
+        with transaction.atomic():
+            users = self.create_users(options['users'], batch_size)
+            recipes = self.create_recipes(users, options['recipes'],
+                                          batch_size)
+            self.create_relations(users, recipes, options, batch_size)
+            recount()
+            update_search_vectors(RecipeList.objects.filter(id__in=recipes))
+            for name in ('tags', 'ingredients', 'recipe-ingredients',
+                         'recipes'):
+                transaction.on_commit(lambda name=name: bump_version(name))
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {len(users)} users and {len(recipes)} recipes'))
+
+    def create_users(self, count, batch_size):
+        start = User.objects.count()
+        password = make_password('benchmark-password')
+        User.objects.bulk_create(
+            [User(username=f'bench{number}',
+                  email=f'bench{number}@example.com',
+                  first_name='Bench', last_name=str(number),
+                  password=password)
+             for number in range(start, start + count)],
+            batch_size=batch_size,
+        )
+        return list(User.objects.filter(
+            username__startswith='bench').order_by('id').values_list(
+                'id', flat=True))[-count:]
+
+    def create_recipes(self, users, count, batch_size):
+        author_weights = zipf_weights(len(users))
+        ingredients = list(Ingredient.objects.values_list('id', flat=True))
+        ingredient_weights = zipf_weights(len(ingredients))
+        tags = list(Tag.objects.values_list('id', flat=True))
+        start = RecipeList.objects.count()
+        RecipeList.objects.bulk_create(
+            [RecipeList(
+                author_id=self.random.choices(
+                    users, cum_weights=author_weights)[0],
+                name=(f'{self.random.choice(WORDS).capitalize()} '
+                      f'№{number}'),
+                text=' '.join(self.random.choices(WORDS, k=30)),
+                cooking_time=max(1, int(self.random.lognormvariate(3.3, .6))),
+                image='recipes/images/benchmark.png',
+            ) for number in range(start, start + count)],
+            batch_size=batch_size,
+        )
+        recipes = list(RecipeList.objects.order_by('id').values_list(
+            'id', flat=True))[-count:]
+        IngredientInRecipe.objects.bulk_create(
+            [IngredientInRecipe(recipe_id=recipe, ingredient_id=ingredient,
+                                amount=self.random.randint(1, 500))
+             for recipe in recipes
+             for ingredient in self.pick(ingredients, ingredient_weights,
+                                         self.random.randint(3, 12))],
+            batch_size=batch_size,
+        )
+        RecipeList.tags.through.objects.bulk_create(
+            [RecipeList.tags.through(recipelist_id=recipe, tag_id=tag)
+             for recipe in recipes
+             for tag in self.random.sample(tags, self.random.randint(1, 3))],
+            batch_size=batch_size,
+        )
+        return recipes
+
+    def create_relations(self, users, recipes, options, batch_size):
+        author_weights = zipf_weights(len(users))
+        recipe_weights = zipf_weights(len(recipes))
+        for model, field, population, weights, mean in (
+            (Subscribe, 'author_id', users, author_weights,
+             options['subscriptions']),
+            (FavoriteRecipe, 'recipe_id', recipes, recipe_weights,
+             options['favorites']),
+            (ShoppingCart, 'recipe_id', recipes, recipe_weights,
+             options['cart']),
+        ):
+            rows = []
+            for user in users:
+                count = self.skewed_count(
+                    mean, min(len(population) // 2, int(mean * 20)))
+                rows.extend(
+                    model(user_id=user, **{field: target})
+                    for target in self.pick(population, weights, count)
+                    if target != user or model is not Subscribe)
+            model.objects.bulk_create(rows, batch_size=batch_size,
+                                      ignore_conflicts=True)
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes.loaders import LOADERS
+
+
+class Command(BaseCommand):
+    help = 'Import ingredient or tag seeds from a json or csv file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', choices=sorted(LOADERS),
+                            help='what to import')
+        parser.add_argument('file', type=str, help='path to file')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='rows per insert')
+        parser.add_argument('--copy', action='store_true',
+                            help='use COPY on PostgreSQL')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        count = LOADERS[options['model']].load(
+            options['file'], options['batch_size'], options['copy'])
+        seconds = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {count} {options["model"]} in {seconds:.2f} s '
+            f'({count / seconds:.0f} rows/s)'
+        ))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from recipes import feed
+
+
+class Command(BaseCommand):
+    help = 'Cut the feeds to the last FEED_MAX_LENGTH recipes, run by cron'
+
+    def handle(self, *args, **options):
+        removed = feed.trim_all()
+        self.stdout.write(self.style.SUCCESS(
+            f'{removed} feed entries are removed'))
@@ -0,0 +1,85 @@
+# Generated by Django 3.2.19 on 2026-10-18 01:26
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def remove_duplicate_ingredients(apps, schema_editor):
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    IngredientInRecipe = apps.get_model('recipes', 'IngredientInRecipe')
+    duplicates = Ingredient.objects.values(
+        'name', 'measurement_unit'
+    ).annotate(
+        count=Count('id'), keep_id=Min('id')
+    ).filter(count__gt=1).order_by()
+    for duplicate in duplicates:
+        extra = Ingredient.objects.filter(
+            name=duplicate['name'],
+            measurement_unit=duplicate['measurement_unit'],
+        ).exclude(id=duplicate['keep_id'])
+        links = IngredientInRecipe.objects.filter(ingredient__in=extra)
+        links.filter(
+            recipe__recipe_ingredients__ingredient_id=duplicate['keep_id']
+        ).delete()
+        links.update(ingredient_id=duplicate['keep_id'])
+        extra.delete()
+
+
+def create_upper_name_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS ingredient_upper_name_like_idx '
+            'ON recipes_ingredient (UPPER(name::text) text_pattern_ops)'
+        )
+
+
+def drop_upper_name_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            'DROP INDEX IF EXISTS ingredient_upper_name_like_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='favoriterecipe',
+            name='unique_favorite_list_user',
+        ),
+        migrations.RemoveConstraint(
+            model_name='shoppingcart',
+            name='unique_cart_list_user',
+        ),
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=models.Index(fields=['name'], name='ingredient_name_like_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='recipelist',
+            index=models.Index(fields=['-pub_date'], name='recipe_pub_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipelist',
+            index=models.Index(fields=['author', '-pub_date'], name='recipe_author_pub_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='favoriterecipe',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_favorite_list_user'),
+        ),
+        migrations.RunPython(
+            remove_duplicate_ingredients, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient'),
+        ),
+        migrations.AddConstraint(
+            model_name='shoppingcart',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_cart_list_user'),
+        ),
+        migrations.RunPython(
+            create_upper_name_index, drop_upper_name_index),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 3.2.19 on 2026-10-18 01:27
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+COUNTERS = (
+    ('recipes.RecipeList', 'favorites_count',
+     'recipes.FavoriteRecipe', 'recipe'),
+    ('recipes.RecipeList', 'shopping_cart_count',
+     'recipes.ShoppingCart', 'recipe'),
+    ('users.User', 'recipes_count',
+     'recipes.RecipeList', 'author'),
+    ('users.User', 'subscribers_count',
+     'users.Subscribe', 'author'),
+)
+
+
+def recount_counters(apps, schema_editor):
+    for model_name, field, related_model_name, related_field in COUNTERS:
+        model = apps.get_model(model_name)
+        actual = Coalesce(
+            Subquery(
+                apps.get_model(related_model_name).objects.filter(
+                    **{related_field: OuterRef('pk')}
+                ).order_by().values(related_field).annotate(
+                    count=Count('pk')
+                ).values('count')
+            ),
+            0,
+        )
+        model.objects.exclude(**{field: actual}).update(**{field: actual})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0003_indexes'),
+        ('users', '0002_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipelist',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном'),
+        ),
+        migrations.AddField(
+            model_name='recipelist',
+            name='shopping_cart_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В списках покупок'),
+        ),
+        migrations.RunPython(recount_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 3.2.19 on 2026-10-18 01:29
+
+from django.db import migrations, models
+import recipes.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_counters'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipelist',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=recipes.storage.HashedImageStorage(), upload_to='static/recipe/', verbose_name='Ссылка на картинку на сайте'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 3.2.19 on 2026-10-18 01:30
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS recipe_search_vector_idx '
+        'ON recipes_recipelist USING GIN (search_vector)'
+    )
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS recipe_name_trgm_idx '
+        'ON recipes_recipelist USING GIN (name gin_trgm_ops)'
+    )
+    schema_editor.execute(
+        "UPDATE recipes_recipelist AS recipe SET search_vector = "
+        "setweight(to_tsvector('russian', recipe.name), 'A') || "
+        "setweight(to_tsvector('russian', recipe.text), 'B') || "
+        "setweight(to_tsvector('russian', coalesce(("
+        "SELECT string_agg(ingredient.name, ' ') "
+        "FROM recipes_ingredientinrecipe AS item "
+        "JOIN recipes_ingredient AS ingredient "
+        "ON ingredient.id = item.ingredient_id "
+        "WHERE item.recipe_id = recipe.id), '')), 'C')"
+    )
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS recipe_search_vector_idx')
+    schema_editor.execute('DROP INDEX IF EXISTS recipe_name_trgm_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_image_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipelist',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Поисковый вектор'),
+        ),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -1,8 +1,11 @@
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVectorField
 from django.core import validators
 from django.db import models
+from django.db.models import Prefetch
 
 from core import constants
+from recipes.storage import HashedImageStorage
 
 
 User = get_user_model()
@@ -50,11 +53,37 @@ class Ingredient(models.Model):
         ordering = ('name',)
         verbose_name = 'Ingredient'
         verbose_name_plural = 'Ingredients'
+        constraints = (
+            models.UniqueConstraint(
+                fields=['name', 'measurement_unit'],
+                name='unique_ingredient'),
+        )
+        indexes = (
+            models.Index(
+                fields=['name'],
+                name='ingredient_name_like_idx',
+                opclasses=['varchar_pattern_ops']),
+        )
 
     def __str__(self):
         return f'{self.name}, {self.measurement_unit}.'
 
 
+class RecipeQuerySet(models.QuerySet):
+    '''Queryset of recipes'''
+
+    def with_related(self):
+        '''load author, tags and ingredients in a fixed number of queries'''
+        return self.select_related('author').prefetch_related(
+            'tags',
+            Prefetch(
+                'recipe_ingredients',
+                queryset=IngredientInRecipe.objects.select_related(
+                    'ingredient'),
+            ),
+        )
+
+
 class RecipeList(models.Model):
     '''Recipe-model'''
     author = models.ForeignKey(
@@ -70,6 +99,7 @@ class RecipeList(models.Model):
     image = models.ImageField(
         'Ссылка на картинку на сайте',
         upload_to='static/recipe/',
+        storage=HashedImageStorage(),
         blank=True,
         null=True,
     )
@@ -104,11 +134,36 @@ class RecipeList(models.Model):
         'Дата публикации',
         auto_now_add=True,
     )
+    favorites_count = models.PositiveIntegerField(
+        'В избранном',
+        default=0,
+        editable=False,
+    )
+    shopping_cart_count = models.PositiveIntegerField(
+        'В списках покупок',
+        default=0,
+        editable=False,
+    )
+    search_vector = SearchVectorField(
+        'Поисковый вектор',
+        null=True,
+        editable=False,
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Recipe'
         verbose_name_plural = 'Recipes'
         ordering = ('-pub_date',)
+        indexes = (
+            models.Index(
+                fields=['-pub_date'],
+                name='recipe_pub_date_idx'),
+            models.Index(
+                fields=['author', '-pub_date'],
+                name='recipe_author_pub_date_idx'),
+        )
 
     def __str__(self):
         return f'{self.author.email}, {self.name}'
@@ -172,6 +227,8 @@ class RecipeUserList(models.Model):
 
 class FavoriteRecipe(RecipeUserList):
     '''Favorite-model'''
+    counter_field = 'favorites_count'
+
     class Meta(RecipeUserList.Meta):
         default_related_name = 'favorites'
         verbose_name = 'Избранное'
@@ -179,7 +236,7 @@ class FavoriteRecipe(RecipeUserList):
         ordering = ('-id',)
         constraints = (
             models.UniqueConstraint(
-                fields=['recipe', 'user'],
+                fields=['user', 'recipe'],
                 name='unique_favorite_list_user',
             ),
         )
@@ -191,13 +248,15 @@ class FavoriteRecipe(RecipeUserList):
 
 class ShoppingCart(RecipeUserList):
     '''Shopping-model'''
+    counter_field = 'shopping_cart_count'
+
     class Meta(RecipeUserList.Meta):
         default_related_name = 'shopping_cart'
         verbose_name = 'Покупка'
         verbose_name_plural = 'Покупки'
         constraints = (
             models.UniqueConstraint(
-                fields=['recipe', 'user'],
+                fields=['user', 'recipe'],
                 name='unique_cart_list_user'
             ),
         )
@@ -205,3 +264,30 @@ class ShoppingCart(RecipeUserList):
     def __str__(self):
         return (f'Пользователь {self.user} '
                 f'добавил {self.recipe.name} в покупки.')
+
+
+class FeedEntry(RecipeUserList):
+    '''Recipe in the timeline of the author subscriber'''
+    pub_date = models.DateTimeField(
+        'Дата публикации',
+    )
+
+    class Meta(RecipeUserList.Meta):
+        default_related_name = 'feed_entries'
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Лента'
+        ordering = ('-pub_date',)
+        constraints = (
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_feed_entry'
+            ),
+        )
+        indexes = (
+            models.Index(
+                fields=['user', '-pub_date'],
+                name='feed_user_pub_date_idx'),
+        )
+
+    def __str__(self):
+        return f'{self.recipe} в ленте {self.user}'
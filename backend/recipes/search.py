@@ -0,0 +1,92 @@
+import weakref
+
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVector,
+    TrigramSimilarity,
+)
+from django.db import connection, transaction
+from django.db.models import (
+    Case,
+    Exists,
+    F,
+    IntegerField,
+    OuterRef,
+    Q,
+    Subquery,
+    Value,
+    When,
+)
+from django.db.models.functions import Coalesce
+
+from core import constants
+from recipes.models import IngredientInRecipe
+
+
+# server connections with the session settings of the search
+_configured = weakref.WeakSet()
+
+
+def update_search_vectors(recipes):
+    '''Recalculate the search vectors of the recipes on PostgreSQL'''
+    if connection.vendor != 'postgresql':
+        return
+    ingredient_names = Subquery(
+        IngredientInRecipe.objects.filter(
+            recipe=OuterRef('pk')
+        ).order_by().values('recipe').annotate(
+            names=StringAgg('ingredient__name', ' ')
+        ).values('names')
+    )
+    recipes.update(search_vector=(
+        SearchVector('name', weight='A', config=constants.SEARCH_CONFIG)
+        + SearchVector('text', weight='B', config=constants.SEARCH_CONFIG)
+        + SearchVector(Coalesce(ingredient_names, Value('')), weight='C',
+                       config=constants.SEARCH_CONFIG)
+    ))
+
+
+def schedule_search_update(recipes):
+    '''Update the search vectors after the commit'''
+    if connection.vendor == 'postgresql':
+        transaction.on_commit(lambda: update_search_vectors(recipes))
+
+
+def set_similarity_threshold(connection):
+    '''Threshold of the `%` operator behind the trigram_similar lookup,
+    set once for the server connection a pool may hand out again'''
+    if connection.connection in _configured:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('SET pg_trgm.similarity_threshold = %s',
+                       [constants.SEARCH_TRIGRAM_THRESHOLD])
+    _configured.add(connection.connection)
+
+
+def search_recipes(queryset, text):
+    '''Recipes matching the text, the most relevant first.
+    Both conditions are answered by the GIN indexes on PostgreSQL,
+    the similarity is computed only to order the matches'''
+    if connection.vendor == 'postgresql':
+        query = SearchQuery(text, config=constants.SEARCH_CONFIG,
+                            search_type='websearch')
+        return queryset.filter(
+            Q(search_vector=query) | Q(name__trigram_similar=text)
+        ).annotate(
+            rank=SearchRank(F('search_vector'), query),
+            similarity=TrigramSimilarity('name', text),
+        ).order_by('-rank', '-similarity', '-pub_date')
+    return queryset.annotate(
+        rank=Case(
+            When(name__icontains=text, then=Value(2)),
+            When(text__icontains=text, then=Value(1)),
+            When(Exists(IngredientInRecipe.objects.filter(
+                recipe=OuterRef('pk'),
+                ingredient__name__icontains=text,
+            )), then=Value(0)),
+            default=Value(-1),
+            output_field=IntegerField(),
+        ),
+    ).filter(rank__gte=0).order_by('-rank', '-pub_date')
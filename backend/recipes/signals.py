@@ -0,0 +1,27 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from recipes.models import Ingredient, RecipeList
+from recipes.search import (
+    schedule_search_update,
+    set_similarity_threshold,
+)
+
+
+@receiver(connection_created)
+def configure_search(connection, **kwargs):
+    if connection.vendor == 'postgresql':
+        set_similarity_threshold(connection)
+
+
+@receiver(post_save, sender=RecipeList)
+def update_recipe_search_vector(instance, **kwargs):
+    schedule_search_update(RecipeList.objects.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=Ingredient)
+def update_ingredient_recipes_search_vectors(instance, created, **kwargs):
+    if not created:
+        schedule_search_update(
+            RecipeList.objects.filter(ingredients=instance))
@@ -0,0 +1,20 @@
+import re
+
+from django.core.files.storage import FileSystemStorage
+
+
+HASHED_NAME = re.compile(r'(^|/)[0-9a-f]{64}(_\d+)?\.\w+$')
+
+
+class HashedImageStorage(FileSystemStorage):
+    '''Stores the file named by the hash of its content only once'''
+
+    def get_available_name(self, name, max_length=None):
+        if HASHED_NAME.search(name):
+            return name
+        return super().get_available_name(name, max_length)
+
+    def _save(self, name, content):
+        if HASHED_NAME.search(name) and self.exists(name):
+            return name
+        return super()._save(name, content)
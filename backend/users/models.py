@@ -35,6 +35,16 @@ class User(AbstractUser):
         max_length=150,
         help_text='Enter the last name',
     )
+    recipes_count = models.PositiveIntegerField(
+        verbose_name='recipes count',
+        default=0,
+        editable=False,
+    )
+    subscribers_count = models.PositiveIntegerField(
+        verbose_name='subscribers count',
+        default=0,
+        editable=False,
+    )
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name']